@@ -1,22 +1,96 @@
+import base64
 import random
+import re
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-from gtts import gTTS
+import requests
+from gtts import gTTS, gTTSError
+from requests.adapters import HTTPAdapter
 
 from utils import settings
+from utils.ratelimit import get_limiter
+from utils.voice import backoff_delay, retry_after
+
+AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
 
 
 class GTTS:
     def __init__(self):
         self.max_chars = 5000
+        self.max_concurrency = 4
+        self.rate_limit = 10  # requests per second
+        self.paces_requests = True
         self.voices = []
+        self.segment_workers = 8  # segments of one clip fetched at the same time
+        self.timeout = (5, 30)  # seconds to connect, seconds to read
+        self.max_retries = 4
+
+        self._session = requests.Session()
+        self._session.mount(
+            "https://",
+            HTTPAdapter(pool_maxsize=self.max_concurrency * self.segment_workers),
+        )
+        self._limiter = get_limiter("GTTS", self.rate_limit)
+
+    def run(self, text, filepath, random_voice: bool = False):
+        """Saves text to filepath.
 
-    def run(self, text, filepath):
+        gTTS splits the text into ~100 character segments and fetches them one after another.
+        Here its prepared requests are sent on a pool instead, and the MP3 segments are joined
+        in order once they are all in.
+        """
         tts = gTTS(
             text=text,
             lang=settings.config["reddit"]["thread"]["post_lang"] or "en",
             slow=False,
         )
-        tts.save(filepath)
+        prepared_requests = tts._prepare_requests()
+        with ThreadPoolExecutor(
+            max_workers=min(self.segment_workers, len(prepared_requests))
+        ) as pool:
+            segments = list(pool.map(lambda request: self._fetch(tts, request), prepared_requests))
+
+        partial = Path(f"{filepath}.partial")
+        with open(partial, "wb") as f:
+            for segment in segments:
+                f.write(segment)
+        partial.replace(filepath)
+
+    def _fetch(self, tts: gTTS, prepared_request: requests.PreparedRequest) -> bytes:
+        """Sends one segment request, retrying 429s, 5xx and connection errors."""
+        for attempt in range(self.max_retries + 1):
+            self._limiter.acquire()
+            try:
+                response = self._session.send(
+                    prepared_request,
+                    proxies=urllib.request.getproxies(),
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    raise gTTSError(tts=tts) from e
+                time.sleep(backoff_delay(attempt))
+                continue
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.max_retries:
+                    raise gTTSError(tts=tts, response=response)
+                delay = retry_after(response) if response.status_code == 429 else None
+                time.sleep(delay if delay is not None else backoff_delay(attempt))
+                continue
+            if not response.ok:
+                raise gTTSError(tts=tts, response=response)
+
+            audio = b""
+            for line in response.text.splitlines():
+                if "jQ1olc" in line:
+                    audio_search = AUDIO_PATTERN.search(line)
+                    if not audio_search:
+                        raise gTTSError(tts=tts, response=response)
+                    audio += base64.b64decode(audio_search.group(1).encode("ascii"))
+            return audio
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -2,11 +2,15 @@
 import base64
 import random
 import time
-from typing import Final, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Final, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from utils import settings
+from utils.ratelimit import get_limiter
+from utils.voice import backoff_delay, retry_after
 
 __all__ = ["TikTok", "TikTokTTSException"]
 
@@ -88,10 +92,21 @@ class TikTok:
 
         self.URI_BASE = "https://api16-normal-c-useast1a.tiktokv.com/media/api/text/speech/invoke/"
         self.max_chars = 200
+        self.max_concurrency = 4
+        self.rate_limit = settings.config["settings"]["tts"]["tiktok_max_rps"]  # requests per second
+        self.voice_setting = "tiktok_voice"
+        self.paces_requests = True
+        self.credential = settings.config["settings"]["tts"]["tiktok_sessionid"]
+        self.timeout = (5, 30)  # seconds to connect, seconds to read
+        self.max_retries = 5
 
         self._session = requests.Session()
         # set the headers to the session, so we don't have to do it for every request
         self._session.headers = headers
+        # keep one connection per worker open instead of reconnecting for every clip
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self._session.mount("https://", adapter)
+        self._limiter = get_limiter("TikTok", self.rate_limit, self.credential)
 
     def run(self, text: str, filepath: str, random_voice: bool = False):
         if random_voice:
@@ -122,6 +137,19 @@ class TikTok:
         with open(filepath, "wb") as out:
             out.write(decoded_voices)
 
+    def run_many(self, jobs: List[Tuple[str, str]], random_voice: bool = False):
+        """Synthesizes many (text, filepath) jobs at once.
+
+        Up to max_concurrency requests are in flight, and no more than tiktok_max_rps requests
+        are started per second. Every request waits for the rate limiter, retries included.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = [
+                pool.submit(self.run, text, filepath, random_voice) for text, filepath in jobs
+            ]
+            for future in futures:
+                future.result()
+
     def get_voices(self, text: str, voice: Optional[str] = None) -> dict:
         """If voice is not passed, the API will try to use the most fitting voice"""
         # sanitize text
@@ -133,12 +161,24 @@ class TikTok:
         if voice is not None:
             params["text_speaker"] = voice
 
-        # send request
-        try:
-            response = self._session.post(self.URI_BASE, params=params)
-        except ConnectionError:
-            time.sleep(random.randrange(1, 7))
-            response = self._session.post(self.URI_BASE, params=params)
+        # send request, backing off on connection errors, ratelimits and server errors
+        for attempt in range(self.max_retries + 1):
+            self._limiter.acquire()
+            try:
+                response = self._session.post(self.URI_BASE, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt == self.max_retries:
+                raise TikTokTTSException(
+                    response.status_code, f"HTTP {response.status_code} after {attempt} retries"
+                )
+            delay = retry_after(response) if response.status_code == 429 else None
+            time.sleep(delay if delay is not None else backoff_delay(attempt))
 
         return response.json()
 
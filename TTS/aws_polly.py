@@ -1,10 +1,18 @@
+import json
 import random
-import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+from xml.sax.saxutils import escape
 
 from boto3 import Session
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
 
 from utils import settings
+from utils.audio import split_mp3
+from utils.ratelimit import get_limiter
 
 voices = [
     "Brian",
@@ -25,53 +33,147 @@ voices = [
 ]
 
 
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_polly_client(max_pool_connections: int = 10):
+    """Returns the Polly client shared by this process, creating it on first use.
+
+    boto3 sessions aren't thread safe but clients are, so the session is only used here.
+    Throttling and transient errors are retried by botocore in adaptive mode, which also slows
+    the client down while Polly is throttling it.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                session = Session(profile_name="polly")
+            except ProfileNotFound as e:
+                raise AWSPollyException(
+                    "You need to install the AWS CLI and configure your profile\n"
+                    "Linux: https://docs.aws.amazon.com/polly/latest/dg/setup-aws-cli.html\n"
+                    "Windows: https://docs.aws.amazon.com/polly/latest/dg/install-voice-plugin2.html"
+                ) from e
+            config = Config(
+                retries={"mode": "adaptive", "max_attempts": 5},
+                max_pool_connections=max_pool_connections,
+            )
+            # e.g. http://localhost:4566 to run against a local stub of the Polly API
+            endpoint_url = settings.config["settings"]["tts"].get("aws_polly_endpoint") or None
+            _client = session.client("polly", config=config, endpoint_url=endpoint_url)
+        return _client
+
+
 class AWSPolly:
     def __init__(self):
         self.max_chars = 3000
+        self.max_concurrency = 8
+        self.rate_limit = 8  # requests per second
+        self.voice_setting = "aws_polly_voice"
         self.voices = voices
+        self.credential = settings.config["settings"]["tts"].get("aws_polly_endpoint") or "polly"
+        # pack several short clips into one SSML request, see run_many
+        self.packs_requests = settings.config["settings"]["tts"]["aws_polly_packing"]
+        self.batch_size = 50
 
     def run(self, text, filepath, random_voice: bool = False):
-        try:
-            session = Session(profile_name="polly")
-            polly = session.client("polly")
-            if random_voice:
-                voice = self.randomvoice()
-            else:
-                if not settings.config["settings"]["tts"]["aws_polly_voice"]:
-                    raise ValueError(
-                        f"Please set the TOML variable AWS_VOICE to a valid voice. options are: {voices}"
-                    )
-                voice = str(settings.config["settings"]["tts"]["aws_polly_voice"]).capitalize()
-            try:
-                # Request speech synthesis
-                response = polly.synthesize_speech(
-                    Text=text, OutputFormat="mp3", VoiceId=voice, Engine="neural"
+        polly = get_polly_client(self.max_concurrency)
+        if random_voice:
+            voice = self.randomvoice()
+        else:
+            if not settings.config["settings"]["tts"]["aws_polly_voice"]:
+                raise ValueError(
+                    f"Please set the TOML variable AWS_VOICE to a valid voice. options are: {voices}"
                 )
-            except (BotoCoreError, ClientError) as error:
-                # The service returned an error, exit gracefully
-                print(error)
-                sys.exit(-1)
-
-            # Access the audio stream from the response
-            if "AudioStream" in response:
-                file = open(filepath, "wb")
-                file.write(response["AudioStream"].read())
-                file.close()
-                # print_substep(f"Saved Text {idx} to MP3 files successfully.", style="bold green")
-
-            else:
-                # The response didn't contain audio data, exit gracefully
-                print("Could not stream audio")
-                sys.exit(-1)
-        except ProfileNotFound:
-            print("You need to install the AWS CLI and configure your profile")
-            print(
-                """
-            Linux: https://docs.aws.amazon.com/polly/latest/dg/setup-aws-cli.html
-            Windows: https://docs.aws.amazon.com/polly/latest/dg/install-voice-plugin2.html
-            """
+            voice = str(settings.config["settings"]["tts"]["aws_polly_voice"]).capitalize()
+        # Request speech synthesis
+        response = self._synthesize(polly, Text=text, OutputFormat="mp3", VoiceId=voice)
+        partial = Path(f"{filepath}.partial")
+        with response["AudioStream"] as stream, open(partial, "wb") as file:
+            for chunk in iter(lambda: stream.read(64 * 1024), b""):
+                file.write(chunk)
+        partial.replace(filepath)
+
+    def run_many(self, jobs: List[Tuple[str, str]], random_voice: bool = False):
+        """Synthesizes many (text, filepath) jobs with as few requests as possible.
+
+        Consecutive texts are packed into one SSML request with a <mark> before each of them. The
+        mark timestamps come from a second request for speech marks, and the MP3 is cut at those
+        times into one file per job. Each pack costs two requests however many clips it holds.
+        """
+        polly = get_polly_client(self.max_concurrency)
+        limiter = get_limiter("AWSPolly", self.rate_limit, self.credential)
+        if not random_voice:
+            voice = str(settings.config["settings"]["tts"]["aws_polly_voice"]).capitalize()
+
+        def synthesize_pack(pack: List[Tuple[str, str]]):
+            pack_voice = self.randomvoice() if random_voice else voice
+            ssml = self._pack_ssml([text for text, _ in pack])
+            limiter.acquire()
+            response = self._synthesize(
+                polly,
+                Text=ssml,
+                TextType="ssml",
+                OutputFormat="json",
+                SpeechMarkTypes=["ssml"],
+                VoiceId=pack_voice,
+            )
+            with response["AudioStream"] as stream:
+                marks = [json.loads(line) for line in stream.read().splitlines() if line.strip()]
+            times = {mark["value"]: mark["time"] / 1000 for mark in marks}
+            limiter.acquire()
+            response = self._synthesize(
+                polly, Text=ssml, TextType="ssml", OutputFormat="mp3", VoiceId=pack_voice
             )
-            sys.exit(-1)
+            with response["AudioStream"] as stream:
+                audio = stream.read()
+            try:
+                cut_times = [times[str(i)] for i in range(1, len(pack))]
+            except KeyError as e:
+                raise AWSPollyException(f"AWS Polly didn't return the speech mark {e}") from e
+            for (_, filepath), part in zip(pack, split_mp3(audio, cut_times)):
+                with open(filepath, "wb") as file:
+                    file.write(part)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for future in [pool.submit(synthesize_pack, pack) for pack in self._packs(jobs)]:
+                future.result()
+
+    def _packs(self, jobs: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """Groups jobs so each pack stays within max_chars billed characters."""
+        packs: List[List[Tuple[str, str]]] = []
+        chars = 0
+        for job in jobs:
+            if not packs or chars + len(job[0]) > self.max_chars:
+                packs.append([])
+                chars = 0
+            packs[-1].append(job)
+            chars += len(job[0])
+        return packs
+
+    @staticmethod
+    def _pack_ssml(texts: List[str]) -> str:
+        # the break gives every cut a bit of silence to land in
+        body = '<break time="250ms"/>'.join(
+            f'<mark name="{i}"/>{escape(text)}' for i, text in enumerate(texts)
+        )
+        return f"<speak>{body}</speak>"
+
+    @staticmethod
+    def _synthesize(polly, **kwargs) -> dict:
+        try:
+            response = polly.synthesize_speech(Engine="neural", **kwargs)
+        except (BotoCoreError, ClientError) as error:
+            raise AWSPollyException(f"AWS Polly couldn't synthesize the text: {error}") from error
+        # Access the audio stream from the response
+        if "AudioStream" not in response:
+            raise AWSPollyException("AWS Polly didn't return an audio stream")
+        return response
 
     def randomvoice(self):
         return random.choice(self.voices)
+
+
+class AWSPollyException(Exception):
+    pass
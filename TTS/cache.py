@@ -0,0 +1,103 @@
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional
+
+
+class TTSCache:
+    """Content addressed store of synthesized clips, kept under a byte budget.
+
+    Entries are keyed by provider, voice, language and text, and live outside assets/temp so
+    cleanup doesn't remove them. The least recently used entries are evicted first.
+
+    Args:
+        directory (str): Where the cached clips are kept
+        max_bytes (int): Size the cache is trimmed back to after it grows past it
+    """
+
+    def __init__(self, directory: str = "assets/tts_cache", max_bytes: int = 512 * 1024**2):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def key(provider: str, voice: Optional[str], lang: Optional[str], text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            "\0".join((provider, str(voice or ""), str(lang or ""), text_hash)).encode("utf-8")
+        ).hexdigest()
+
+    def entry(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.mp3"
+
+    def get(self, key: str, filepath: str) -> bool:
+        """Serves a cached clip to filepath by hard link, or by copy where linking isn't possible.
+
+        Returns:
+            bool: Whether the clip was in the cache
+        """
+        entry = self.entry(key)
+        try:
+            os.utime(entry)  # mark as recently used
+        except FileNotFoundError:
+            return False
+        Path(filepath).unlink(missing_ok=True)
+        try:
+            os.link(entry, filepath)
+        except FileNotFoundError:  # evicted by another worker in the meantime
+            return False
+        except OSError:
+            shutil.copyfile(entry, filepath)
+        return True
+
+    def put(self, key: str, filepath: str):
+        """Stores a copy of filepath. Empty or missing files are not cached."""
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            return
+        if not size:
+            return
+        entry = self.entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        partial = entry.with_name(f"{entry.name}.{uuid.uuid4().hex}.partial")
+        shutil.copyfile(filepath, partial)
+        os.replace(partial, entry)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._size = self.evict()
+
+    def evict(self) -> int:
+        """Removes the least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+            int: Size of the cache in bytes afterwards
+        """
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry in entries:
+            if size <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+        return size
+
+    def _disk_usage(self) -> int:
+        return sum(entry_size for _, entry_size, _ in self._entries())
+
+    def _entries(self):
+        for entry in self.directory.glob("*/*.mp3"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # removed by another process
+                continue
+            yield stat.st_mtime, stat.st_size, entry
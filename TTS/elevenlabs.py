@@ -1,14 +1,40 @@
 import random
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
 
-from elevenlabs import save
 from elevenlabs.client import ElevenLabs
 
 from utils import settings
+from utils.console import print_substep
+
+VOICE_CATALOG_TTL = 3600  # seconds
+
+_voice_catalog: Optional[Tuple[float, List[str]]] = None
+_voice_catalog_lock = threading.Lock()
+
+
+def get_voice_names(client: ElevenLabs) -> List[str]:
+    """Returns the names of the voices available to the account.
+
+    The catalog is fetched once per process and refreshed after VOICE_CATALOG_TTL seconds.
+    """
+    global _voice_catalog
+    with _voice_catalog_lock:
+        if _voice_catalog is None or time.monotonic() - _voice_catalog[0] > VOICE_CATALOG_TTL:
+            names = [voice.name for voice in client.voices.get_all().voices]
+            _voice_catalog = (time.monotonic(), names)
+        return _voice_catalog[1]
 
 
 class elevenlabs:
     def __init__(self):
         self.max_chars = 2500
+        self.max_concurrency = 2
+        self.rate_limit = 2  # requests per second
+        self.voice_setting = "elevenlabs_voice_name"
+        self.credential = settings.config["settings"]["tts"].get("elevenlabs_api_key")
         self.client: ElevenLabs = None
 
     def run(self, text, filepath, random_voice: bool = False):
@@ -19,8 +45,25 @@ class elevenlabs:
         else:
             voice = str(settings.config["settings"]["tts"]["elevenlabs_voice_name"]).capitalize()
 
-        audio = self.client.generate(text=text, voice=voice, model="eleven_multilingual_v1")
-        save(audio=audio, filename=filepath)
+        start = time.perf_counter()
+        audio = self.client.generate(
+            text=text, voice=voice, model="eleven_multilingual_v1", stream=True
+        )
+        # write the chunks as they arrive instead of buffering the whole clip
+        partial = Path(f"{filepath}.partial")
+        first_chunk = None
+        with open(partial, "wb") as f:
+            for chunk in audio:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                f.write(chunk)
+        partial.replace(filepath)
+        if first_chunk is not None:
+            print_substep(
+                f"ElevenLabs: first audio after {first_chunk:.2f}s, "
+                f"done after {time.perf_counter() - start:.2f}s",
+                style="dim",
+            )
 
     def initialize(self):
         if settings.config["settings"]["tts"]["elevenlabs_api_key"]:
@@ -35,4 +78,4 @@ class elevenlabs:
     def randomvoice(self):
         if self.client is None:
             self.initialize()
-        return random.choice(self.client.voices.get_all().voices).voice_name
+        return random.choice(get_voice_names(self.client))
@@ -1,22 +1,37 @@
 import os
 import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-import numpy as np
 import translators
-from moviepy.audio.AudioClip import AudioClip
-from moviepy.audio.fx.volumex import volumex
-from moviepy.editor import AudioFileClip
 from rich.progress import track
 
+from TTS.cache import TTSCache
 from utils import settings
+from utils.audio import (
+    CANONICAL_CHANNELS,
+    CANONICAL_CODEC,
+    CANONICAL_SAMPLE_RATE,
+    concat_wav,
+    get_audio_info,
+    get_duration,
+)
 from utils.console import print_step, print_substep
+from utils.manifest import ClipInfo, save_manifest
+from utils.ratelimit import RateLimiter, get_limiter, limiter_metrics
 from utils.voice import sanitize_text
 
 DEFAULT_MAX_LENGTH: int = (
     50  # Video length variable, edit this on your own risk. It should work, but it's not supported
 )
+SILENCE_DIR: str = "assets/temp/silence"
+# roughly how fast the TTS voices speak, used to guess lengths before synthesizing
+CHARS_PER_SECOND: int = 15
+
+_silence_lock = threading.Lock()
 
 
 class TTSEngine:
@@ -30,6 +45,14 @@ class TTSEngine:
 
     Notes:
         tts_module must take the arguments text and filepath.
+        tts_module may set max_concurrency and rate_limit (requests per second) to bound concurrent synthesis.
+        tts_module may set paces_requests if it applies rate_limit to its own requests.
+        tts_module may set credential so accounts with separate quotas get separate ratelimits.
+        tts_module may set name if clips should be cached as another provider's than its class.
+        tts_module may set is_fallback(filepath) if a clip can come from another voice than the
+        configured one. Such clips are not cached, so they are never served as that voice.
+        tts_module may set packs_requests and batch_size if its run_many(jobs, random_voice)
+        synthesizes several (text, filepath) jobs with fewer requests than one per clip.
     """
 
     def __init__(
@@ -49,6 +72,33 @@ class TTSEngine:
         self.length = 0
         self.last_clip_length = last_clip_length
 
+        self.concurrent = settings.config["settings"]["tts"]["concurrent_synthesis"]
+        self.max_workers = getattr(self.tts_module, "max_concurrency", 1)
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self.packs_requests = getattr(self.tts_module, "packs_requests", False)
+        # modules that pace their own requests (and retries) would otherwise wait twice
+        self._limiter = (
+            RateLimiter(0)
+            if getattr(self.tts_module, "paces_requests", False)
+            else get_limiter(
+                type(self.tts_module).__name__,
+                getattr(self.tts_module, "rate_limit", 0),
+                getattr(self.tts_module, "credential", None),
+            )
+        )
+        self.cache = (
+            TTSCache(max_bytes=settings.config["settings"]["tts"]["tts_cache_max_mb"] * 1024**2)
+            if settings.config["settings"]["tts"]["tts_cache"]
+            else None
+        )
+        # "wav" decodes every clip once, right after synthesis, into one PCM format
+        self.canonical = settings.config["settings"]["tts"]["intermediate_format"] == "wav"
+        self.clips: Dict[str, ClipInfo] = {}
+
+    def clip_path(self, filename: str) -> str:
+        """Where a finished clip is saved. PCM clips are .wav, everything else .mp3."""
+        return f"{self.path}/{filename}.{'wav' if self.canonical else 'mp3'}"
+
     def add_periods(
         self,
     ):  # adds periods to the end of paragraphs (where people often forget to put them) so tts doesn't blend sentences
@@ -71,48 +121,198 @@ class TTSEngine:
         print_step("Saving Text to MP3 files...")
 
         self.add_periods()
-        self.call_tts("title", process_text(self.reddit_object["thread_title"]))
+        title = ("title", self.reddit_object["thread_title"], False)
         # processed_text = ##self.reddit_object["thread_post"] != ""
         idx = 0
 
         if settings.config["settings"]["storymode"]:
+            clips = [title]
             if settings.config["settings"]["storymodemethod"] == 0:
-                if len(self.reddit_object["thread_post"]) > self.tts_module.max_chars:
-                    self.split_post(self.reddit_object["thread_post"], "postaudio")
-                else:
-                    self.call_tts("postaudio", process_text(self.reddit_object["thread_post"]))
+                clips.append(("postaudio", self.reddit_object["thread_post"], True))
             elif settings.config["settings"]["storymodemethod"] == 1:
-                for idx, text in track(enumerate(self.reddit_object["thread_post"])):
-                    self.call_tts(f"postaudio-{idx}", process_text(text))
-
+                clips += [
+                    (f"postaudio-{idy}", text, False)
+                    for idy, text in enumerate(self.reddit_object["thread_post"])
+                ]
+                idx = max(len(self.reddit_object["thread_post"]) - 1, 0)
+            for duration in self.save_batch(clips, "Saving..."):
+                self.add_length(duration)
         else:
-            for idx, comment in track(enumerate(self.reddit_object["comments"]), "Saving..."):
+            idx = self.save_comments(title)
+
+        save_manifest(self.redditid, clips=self.clips)
+        for key, metrics in limiter_metrics().items():
+            if metrics["waits"]:
+                print_substep(
+                    f"Ratelimit {key}: {metrics['waits']}/{metrics['calls']} requests waited, "
+                    f"{metrics['wait_total']:.1f}s in total, {metrics['wait_max']:.1f}s at most",
+                    style="dim",
+                )
+        print_substep("Saved Text to MP3 files successfully.", style="bold green")
+        return self.length, idx
+
+    def save_comments(self, title: tuple) -> int:
+        """Saves the title and as many comments as fit in max_length.
+
+        In concurrent mode comments are synthesized in windows of max_concurrency clips, and the
+        cutoff is applied to the results in comment order, so the kept clips are the same as in
+        sequential mode. Packed windows are sized by comment_windows.
+
+        Returns:
+            int: The index returned to make_final_video as the number of comments
+        """
+        comments = self.reddit_object["comments"]
+        idx = 0
+        for start, end in track(self.comment_windows(title[1]), "Saving..."):
+            if self.length > self.max_length and start > 1:
+                # the clip before this window already crossed max_length
+                self.length -= self.last_clip_length
+                return start - 1
+            batch = [
+                (f"{idx}", comment["comment_body"], True)
+                for idx, comment in enumerate(comments[start:end], start)
+            ]
+            if start == 0:
+                batch.insert(0, title)
+            durations = self.save_batch(batch)
+            if start == 0:
+                self.add_length(durations.pop(0))
+            for idx, duration in enumerate(durations, start):
                 # ! Stop creating mp3 files if the length is greater than max length.
                 if self.length > self.max_length and idx > 1:
                     self.length -= self.last_clip_length
-                    idx -= 1
-                    break
-                if (
-                    len(comment["comment_body"]) > self.tts_module.max_chars
-                ):  # Split the comment if it is too long
-                    self.split_post(comment["comment_body"], idx)  # Split the comment
-                else:  # If the comment is not too long, just call the tts engine
-                    self.call_tts(f"{idx}", process_text(comment["comment_body"]))
+                    return idx - 1
+                self.add_length(duration)
+        return idx
 
-        print_substep("Saved Text to MP3 files successfully.", style="bold green")
-        return self.length, idx
+    def comment_windows(self, title: str) -> Iterator[Tuple[int, int]]:
+        """Yields the (start, end) comment ranges save_comments synthesizes together.
 
-    def split_post(self, text: str, idx):
-        split_files = []
-        split_text = [
-            x.group().strip()
-            for x in re.finditer(
-                r" *(((.|\n){0," + str(self.tts_module.max_chars) + "})(\.|.$))", text
+        Packed requests hold up to batch_size comments, but only as many as the max_length
+        left is estimated to fit at CHARS_PER_SECOND, plus the one that crosses it. Comments
+        past the cutoff would be synthesized and billed for nothing. The estimate is made
+        when the window is started, after the previous windows were added to self.length.
+        """
+        comments = self.reddit_object["comments"]
+        window = self.max_workers if self.concurrent else 1
+        start = 0
+        while start == 0 or start < len(comments):
+            if not self.packs_requests:
+                end = start + window
+            else:
+                budget = (self.max_length - self.length) * CHARS_PER_SECOND
+                chars = len(title) if start == 0 else 0
+                end = start
+                while (
+                    end < len(comments)
+                    and end - start < self.tts_module.batch_size
+                    and chars <= budget
+                ):
+                    chars += len(comments[end]["comment_body"])
+                    end += 1
+            yield start, end
+            start = max(end, start + 1)
+
+    def save_batch(self, clips: List[tuple], description: Optional[str] = None) -> List[float]:
+        """Saves (filename, text, split) clips and returns their lengths in clip order.
+
+        If the TTS module packs requests, the clips that fit in one request are handed to its
+        run_many together. Everything else goes through save_clip.
+        """
+        if not self.packs_requests:
+            return self._map(self.save_clip, clips, description)
+
+        durations: Dict[str, float] = {}
+        jobs = []
+        single = []
+        for filename, text, split in clips:
+            if split and len(text) > self.tts_module.max_chars:
+                single.append((filename, text, split))
+                continue
+            text = process_text(text)
+            filepath = self.clip_path(filename)
+            if self.cache is not None and self.cache.get(self.cache_key(text), filepath):
+                durations[filename] = get_duration(filepath)
+                self.record_clip(filename, text)
+            else:
+                jobs.append((filename, text))
+        if jobs:
+            if description is not None:
+                print_substep(f"{description} ({len(jobs)} clips in packed requests)")
+            for filename, _ in jobs:
+                # never write through a hard link into the cache
+                Path(f"{self.path}/{filename}.mp3").unlink(missing_ok=True)
+                Path(self.clip_path(filename)).unlink(missing_ok=True)
+            self.tts_module.run_many(
+                [(text, f"{self.path}/{filename}.mp3") for filename, text in jobs],
+                random_voice=settings.config["settings"]["tts"]["random_voice"],
             )
-        ]
-        self.create_silence_mp3()
+            # a pack can come back with fewer clips than it held, e.g. when a cut falls past
+            # the end of its audio. Those clips are synthesized on their own instead
+            missing = [
+                (filename, text)
+                for filename, text in jobs
+                if not _has_audio(f"{self.path}/{filename}.mp3")
+            ]
+            if missing:
+                print_substep(
+                    f"{len(missing)} clips were missing from packed requests, "
+                    "synthesizing them one by one",
+                    style="dim",
+                )
+                for (filename, text), duration in zip(missing, self._map(self.call_tts, missing)):
+                    durations[filename] = duration
+                    self.record_clip(filename, text)
+            for filename, text in jobs:
+                if filename in durations:
+                    continue
+                filepath = self.clip_path(filename)
+                if self.canonical:
+                    normalize_clip(f"{self.path}/{filename}.mp3", filepath)
+                if self.cache is not None:
+                    self.cache.put(self.cache_key(text), filepath)
+                durations[filename] = get_duration(filepath)
+                self.record_clip(filename, text)
+        for (filename, _, _), duration in zip(single, self._map(self.save_clip, single)):
+            durations[filename] = duration
+        return [durations[filename] for filename, _, _ in clips]
+
+    def save_clip(self, filename: str, text: str, split: bool = True) -> float:
+        """Saves one clip of the video, splitting the text first if the TTS module needs it.
+
+        Returns:
+            float: Length of the clip in seconds
+        """
+        if split and len(text) > self.tts_module.max_chars:  # Split the text if it is too long
+            length = self.split_post(text, filename)
+        else:
+            text = process_text(text)
+            length = self.call_tts(filename, text)
+        self.record_clip(filename, text)
+        return length
+
+    def record_clip(self, filename: str, text: str):
+        """Adds a finished clip to the job manifest handed to make_final_video."""
+        filepath = self.clip_path(filename)
+        info = get_audio_info(filepath)
+        self.clips[filename] = ClipInfo(
+            path=filepath,
+            duration=info.duration,
+            sample_rate=info.sample_rate,
+            channels=info.channels,
+            codec=info.codec,
+            text=text,
+            voice=self.voice_name(),
+        )
+
+    def add_length(self, duration: float):
+        self.last_clip_length = duration
+        self.length += duration
+
+    def split_post(self, text: str, idx) -> float:
+        split_text = chunk_text(text, self.tts_module.max_chars)
 
-        idy = None
+        parts = []
         for idy, text_cut in enumerate(split_text):
             newtext = process_text(text_cut)
             # print(f"{idx}-{idy}: {newtext}\n")
@@ -120,56 +320,118 @@ class TTSEngine:
             if not newtext or newtext.isspace():
                 print("newtext was blank because sanitized split text resulted in none")
                 continue
-            else:
-                self.call_tts(f"{idx}-{idy}.part", newtext)
-                with open(f"{self.path}/list.txt", "w") as f:
-                    for idz in range(0, len(split_text)):
-                        f.write("file " + f"'{idx}-{idz}.part.mp3'" + "\n")
-                    split_files.append(str(f"{self.path}/{idx}-{idy}.part.mp3"))
-                    f.write("file " + f"'silence.mp3'" + "\n")
-
-                os.system(
-                    "ffmpeg -f concat -y -hide_banner -loglevel panic -safe 0 "
-                    + "-i "
-                    + f"{self.path}/list.txt "
-                    + "-c copy "
-                    + f"{self.path}/{idx}.mp3"
-                )
+            parts.append((f"{idx}-{idy}.part", newtext))
+        if not parts:
+            raise ValueError(f"Nothing is left of clip {idx} after sanitizing its text")
+        length = sum(self._map(self.call_tts, parts))
+
+        split_files = [self.clip_path(filename) for filename, _ in parts]
+        output = self.clip_path(idx)
+        Path(output).unlink(missing_ok=True)
+        temporary_files = list(split_files)
+        part_infos = [get_audio_info(split_file) for split_file in split_files]
+        # providers that return WAV do so in the mp3 intermediate format too, and MP3 silence
+        # can't be stream-copied onto WAV parts
+        pcm_parts = len({(info.codec, info.sample_rate, info.channels) for info in part_infos}) == 1
+        if self.canonical or (pcm_parts and part_infos[0].codec.startswith("pcm_")):
+            # every part has the same PCM format, so joining them is a byte append
+            concat_wav(
+                split_files, output, silence=settings.config["settings"]["tts"]["silence_duration"]
+            )
+        else:
+            first_part = part_infos[0]
+            silence = create_silence_mp3(
+                settings.config["settings"]["tts"]["silence_duration"],
+                first_part.sample_rate,
+                first_part.channels,
+            )
+            list_path = f"{self.path}/{idx}-list.txt"
+            with open(list_path, "w") as f:
+                for split_file in split_files + [silence]:
+                    f.write("file " + concat_quote(os.path.abspath(split_file)) + "\n")
+            temporary_files.append(list_path)
+            run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output])
         try:
-            for i in range(0, len(split_files)):
-                os.unlink(split_files[i])
+            for split_file in temporary_files:
+                os.unlink(split_file)
         except FileNotFoundError as e:
             print("File not found: " + e.filename)
         except OSError:
             print("OSError")
+        return length
+
+    def call_tts(self, filename: str, text: str) -> float:
+        """Saves text to the clip {filename}. Safe to call from several threads at once.
 
-    def call_tts(self, filename: str, text: str):
-        self.tts_module.run(
+        Raises:
+            AudioProbeError: If the saved clip can't be read
+
+        Returns:
+            float: Length of the clip in seconds
+        """
+        filepath = self.clip_path(filename)
+        # TTS modules always write to {filename}.mp3, whatever format they actually produce
+        synthesized = f"{self.path}/{filename}.mp3"
+        key = self.cache_key(text) if self.cache is not None else None
+        if key is None or not self.cache.get(key, filepath):
+            # never write through a hard link into the cache
+            Path(filepath).unlink(missing_ok=True)
+            Path(synthesized).unlink(missing_ok=True)
+            with self._slots:
+                self._limiter.acquire()
+                self.tts_module.run(
+                    text,
+                    filepath=synthesized,
+                    random_voice=settings.config["settings"]["tts"]["random_voice"],
+                )
+            if self.canonical:
+                normalize_clip(synthesized, filepath)
+            is_fallback = getattr(self.tts_module, "is_fallback", None)
+            if is_fallback is not None and is_fallback(synthesized):
+                key = None
+            if key is not None:
+                self.cache.put(key, filepath)
+        return get_duration(filepath)
+
+    def voice_name(self) -> Optional[str]:
+        """The configured voice of the TTS module, "random" if random_voice is set."""
+        if settings.config["settings"]["tts"]["random_voice"]:
+            return "random"
+        voice_setting = getattr(self.tts_module, "voice_setting", None)
+        return settings.config["settings"]["tts"].get(voice_setting) if voice_setting else None
+
+    def cache_key(self, text: str) -> str:
+        """Cache key of a clip. Clips made with a random voice may be served in any voice."""
+        provider = getattr(self.tts_module, "name", type(self.tts_module).__name__)
+        return TTSCache.key(
+            provider + ("/wav" if self.canonical else ""),
+            self.voice_name(),
+            settings.config["reddit"]["thread"]["post_lang"],
             text,
-            filepath=f"{self.path}/{filename}.mp3",
-            random_voice=settings.config["settings"]["tts"]["random_voice"],
-        )
-        # try:
-        #     self.length += MP3(f"{self.path}/{filename}.mp3").info.length
-        # except (MutagenError, HeaderNotFoundError):
-        #     self.length += sox.file_info.duration(f"{self.path}/{filename}.mp3")
-        try:
-            clip = AudioFileClip(f"{self.path}/{filename}.mp3")
-            self.last_clip_length = clip.duration
-            self.length += clip.duration
-            clip.close()
-        except:
-            self.length = 0
-
-    def create_silence_mp3(self):
-        silence_duration = settings.config["settings"]["tts"]["silence_duration"]
-        silence = AudioClip(
-            make_frame=lambda t: np.sin(440 * 2 * np.pi * t),
-            duration=silence_duration,
-            fps=44100,
         )
-        silence = volumex(silence, 0)
-        silence.write_audiofile(f"{self.path}/silence.mp3", fps=44100, verbose=False, logger=None)
+
+    def _map(self, func: Callable, items: List[tuple], description: Optional[str] = None) -> list:
+        """Calls func(*item) for every item and returns the results in item order.
+
+        The calls run on a worker pool when concurrent synthesis is enabled.
+        """
+        if not self.concurrent or len(items) < 2:
+            if description is not None:
+                items = track(items, description)
+            return [func(*item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+            futures = [pool.submit(func, *item) for item in items]
+            if description is not None:
+                for _ in track(as_completed(futures), description, total=len(futures)):
+                    pass
+            return [future.result() for future in futures]
+
+
+def _has_audio(path: str) -> bool:
+    try:
+        return os.path.getsize(path) > 0
+    except OSError:
+        return False
 
 
 def process_text(text: str, clean: bool = True):
@@ -180,3 +442,116 @@ def process_text(text: str, clean: bool = True):
         translated_text = translators.translate_text(text, translator="google", to_language=lang)
         new_text = sanitize_text(translated_text)
     return new_text
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """Greedily packs whole sentences into chunks of at most max_chars characters.
+
+    Sentences that don't fit in a chunk on their own are packed word by word. Only a single word
+    longer than max_chars is ever cut. Runs in one pass, so texts without punctuation are fine.
+
+    Args:
+        text (str): The text to split
+        max_chars (int): Maximum length of a chunk
+
+    Returns:
+        List[str]: The chunks, in order
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_length = 0
+    for sentence in _sentences(text):
+        pieces = [sentence] if len(sentence) <= max_chars else _words(sentence, max_chars)
+        for piece in pieces:
+            if current and current_length + 1 + len(piece) > max_chars:
+                chunks.append(" ".join(current))
+                current = []
+                current_length = 0
+            current_length += len(piece) + (1 if current else 0)
+            current.append(piece)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _sentences(text: str) -> Iterator[str]:
+    start = 0
+    length = len(text)
+    for i, char in enumerate(text):
+        if char in ".!?" and (i + 1 == length or text[i + 1].isspace()):
+            sentence = " ".join(text[start : i + 1].split())
+            if sentence:
+                yield sentence
+            start = i + 1
+    sentence = " ".join(text[start:].split())
+    if sentence:
+        yield sentence
+
+
+def _words(sentence: str, max_chars: int) -> Iterator[str]:
+    for word in sentence.split():
+        for i in range(0, len(word), max_chars):
+            yield word[i : i + max_chars]
+
+
+def create_silence_mp3(duration: float, sample_rate: int = 44100, channels: int = 1) -> str:
+    """Returns the path of a silent MP3 clip, creating it the first time it is asked for.
+
+    Clips are kept in assets/temp/silence, which cleanup doesn't remove, so each
+    (duration, sample rate, channels) is only encoded once.
+    """
+    path = f"{SILENCE_DIR}/silence-{duration}s-{sample_rate}hz-{channels}ch.mp3"
+    with _silence_lock:
+        if not os.path.exists(path):
+            Path(SILENCE_DIR).mkdir(parents=True, exist_ok=True)
+            partial = f"{path}.partial.mp3"
+            layout = "mono" if channels == 1 else "stereo"
+            run_ffmpeg(
+                [
+                    "-f",
+                    "lavfi",
+                    "-i",
+                    f"anullsrc=r={sample_rate}:cl={layout}",
+                    "-t",
+                    str(duration),
+                    "-c:a",
+                    "libmp3lame",
+                    partial,
+                ]
+            )
+            os.replace(partial, path)
+    return path
+
+
+def normalize_clip(source: str, output: str):
+    """Decodes a synthesized clip once into the canonical PCM WAV format and deletes the source."""
+    partial = f"{output}.partial.wav"
+    run_ffmpeg(
+        [
+            "-i",
+            source,
+            "-ar",
+            str(CANONICAL_SAMPLE_RATE),
+            "-ac",
+            str(CANONICAL_CHANNELS),
+            "-c:a",
+            CANONICAL_CODEC,
+            partial,
+        ]
+    )
+    os.replace(partial, output)
+    os.unlink(source)
+
+
+def run_ffmpeg(args: List[str]):
+    """Runs ffmpeg with an argument list, raising with its error output if it fails."""
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *args], capture_output=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf8', 'replace').strip()}")
+
+
+def concat_quote(path: str) -> str:
+    """Quotes a path for an ffmpeg concat list."""
+    return "'" + path.replace("'", "'\\''") + "'"
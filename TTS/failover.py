@@ -0,0 +1,209 @@
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from utils.console import print_substep
+from utils.ratelimit import RateLimiter, get_limiter
+
+LATENCY_STATS_PATH = "assets/tts_latency.json"
+
+
+class LatencyStats:
+    """Rolling per-provider TTS latencies, kept across runs in assets/tts_latency.json.
+
+    Args:
+        path (str): Where the stats are saved
+        window (int): Number of recent requests kept per provider
+    """
+
+    def __init__(self, path: str = LATENCY_STATS_PATH, window: int = 200):
+        self.path = Path(path)
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as raw_stats:
+                    self._stats = json.load(raw_stats)
+            except (OSError, ValueError):
+                self._stats = {}
+
+    def record(self, provider: str, seconds: Optional[float], ok: bool = True):
+        """Records one request. Failed requests only count towards the failure counter."""
+        with self._lock:
+            stats = self._stats.setdefault(provider, {"latencies": [], "failures": 0, "hedged": 0})
+            if ok:
+                stats["latencies"] = (stats["latencies"] + [round(seconds, 3)])[-self.window :]
+            else:
+                stats["failures"] += 1
+            self._save()
+
+    def record_hedge(self, provider: str):
+        with self._lock:
+            stats = self._stats.setdefault(provider, {"latencies": [], "failures": 0, "hedged": 0})
+            stats["hedged"] += 1
+            self._save()
+
+    def percentile(self, provider: str, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """Returns the given latency percentile, or None until min_samples requests are known."""
+        with self._lock:
+            latencies = sorted(self._stats.get(provider, {}).get("latencies", []))
+        if len(latencies) < min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+    def _save(self):
+        """Writes the stats through a temporary file of its own.
+
+        Other processes may be saving theirs at the same time. The stats are only a hint, so
+        errors are ignored.
+        """
+        partial = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.path.parent, suffix=".partial", delete=False
+            ) as raw_stats:
+                partial = Path(raw_stats.name)
+                json.dump(self._stats, raw_stats, indent=4)
+            partial.replace(self.path)
+        except OSError:
+            if partial is not None:
+                partial.unlink(missing_ok=True)
+
+
+class ProviderChain:
+    """A TTS module that tries several providers in order.
+
+    A request goes to the first provider. If it fails, the next provider is asked right away.
+    If it hasn't answered after its hedge_percentile latency, the next provider is asked as
+    well and whichever finishes first wins. Threads can't be cancelled, so a slow provider
+    keeps running in the background and its result is thrown away. Clips made by any provider
+    but the primary one are reported by is_fallback, since they have a different voice.
+
+    Args:
+        providers (List[Callable]): TTS module classes, primary first
+        hedge_percentile (float): Latency percentile of a provider after which it is hedged
+        default_hedge_delay (float): Hedge delay in seconds while a provider has too few samples
+        stats (LatencyStats, optional): Where latencies are recorded
+    """
+
+    def __init__(
+        self,
+        providers: List[Callable],
+        hedge_percentile: float = 95,
+        default_hedge_delay: float = 10.0,
+        stats: Optional[LatencyStats] = None,
+    ):
+        self.providers = [provider() for provider in providers]
+        self.names = [type(provider).__name__ for provider in self.providers]
+        # cached clips are the primary's, is_fallback keeps the others out of the cache
+        self.name = self.names[0]
+        primary = self.providers[0]
+        self.max_chars = min(provider.max_chars for provider in self.providers)
+        self.max_concurrency = getattr(primary, "max_concurrency", 1)
+        self.rate_limit = 0
+        self.paces_requests = True
+        self.voice_setting = getattr(primary, "voice_setting", None)
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.stats = stats or LatencyStats()
+
+        self._slots = [
+            threading.BoundedSemaphore(getattr(provider, "max_concurrency", 1))
+            for provider in self.providers
+        ]
+        # same pacing TTSEngine applies when the provider is used on its own
+        self._limiters = [
+            (
+                RateLimiter(0)
+                if getattr(provider, "paces_requests", False)
+                else get_limiter(
+                    name,
+                    getattr(provider, "rate_limit", 0),
+                    getattr(provider, "credential", None),
+                )
+            )
+            for name, provider in zip(self.names, self.providers)
+        ]
+        self._fallbacks = set()
+        self._fallbacks_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=sum(getattr(provider, "max_concurrency", 1) for provider in self.providers)
+        )
+
+    def run(self, text: str, filepath: str, random_voice: bool = False):
+        pending: Dict[Future, int] = {}
+        error: Optional[BaseException] = None
+        next_provider = 0
+        while True:
+            if next_provider < len(self.providers) and (not pending or error is not None):
+                pending[self._submit(next_provider, text, filepath, random_voice)] = next_provider
+                next_provider += 1
+                error = None
+            if not pending:
+                raise error
+            newest = max(pending.values())
+            timeout = self.hedge_delay(newest) if next_provider < len(self.providers) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # the newest provider is slower than usual, ask the next one as well
+                self.stats.record_hedge(self.names[newest])
+                print_substep(
+                    f"{self.names[newest]} is slow, also asking {self.names[next_provider]}",
+                    style="dim",
+                )
+                pending[self._submit(next_provider, text, filepath, random_voice)] = next_provider
+                next_provider += 1
+                continue
+            for future in done:
+                index = pending.pop(future)
+                if future.exception() is None:
+                    Path(future.result()).replace(filepath)
+                    if index:
+                        with self._fallbacks_lock:
+                            self._fallbacks.add(filepath)
+                    for loser in pending:
+                        loser.add_done_callback(_discard)
+                    return
+                error = future.exception()
+                print_substep(f"{self.names[index]} failed ({error}), trying the next provider")
+
+    def is_fallback(self, filepath: str) -> bool:
+        """Whether the clip last saved to filepath came from a fallback provider. Asked once."""
+        with self._fallbacks_lock:
+            fallback = filepath in self._fallbacks
+            self._fallbacks.discard(filepath)
+        return fallback
+
+    def hedge_delay(self, index: int) -> float:
+        delay = self.stats.percentile(self.names[index], self.hedge_percentile)
+        return self.default_hedge_delay if delay is None else delay
+
+    def _submit(self, index: int, text: str, filepath: str, random_voice: bool) -> Future:
+        return self._pool.submit(self._attempt, index, text, filepath, random_voice)
+
+    def _attempt(self, index: int, text: str, filepath: str, random_voice: bool) -> str:
+        """Runs one provider into its own file, so hedged requests never write the same file."""
+        attempt_path = f"{filepath}.{self.names[index]}"
+        with self._slots[index]:
+            self._limiters[index].acquire()
+            start = time.perf_counter()
+            try:
+                self.providers[index].run(text, filepath=attempt_path, random_voice=random_voice)
+            except Exception:
+                self.stats.record(self.names[index], None, ok=False)
+                Path(attempt_path).unlink(missing_ok=True)
+                raise
+        self.stats.record(self.names[index], time.perf_counter() - start)
+        return attempt_path
+
+
+def _discard(future: Future):
+    if future.exception() is None:
+        Path(future.result()).unlink(missing_ok=True)
@@ -0,0 +1,120 @@
+import hashlib
+import random
+import subprocess
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from utils import settings
+from utils.ratelimit import get_limiter
+
+
+class LocalTTS:
+    """Offline stand-in for a TTS provider, for load tests and benchmarks.
+
+    Every clip is a tone whose pitch and length depend only on the text, so runs are
+    reproducible. Latency, jitter, failures and ratelimits are simulated from the local_tts_*
+    settings, seeded by the text as well.
+    """
+
+    def __init__(self):
+        config = settings.config["settings"]["tts"]
+        self.max_chars = 500
+        self.max_concurrency = 8
+        self.rate_limit = 0
+        self.paces_requests = True
+        self.voices = ["tone", "noise"]
+        self.voice_setting = "local_tts_voice"
+        self.sample_rate = 24000
+        self.seconds_per_char = 0.06
+        self.max_retries = 5
+
+        self.format = config["local_tts_format"]
+        self.latency = config["local_tts_latency"]
+        self.jitter = config["local_tts_jitter"]
+        self.failure_rate = config["local_tts_failure_rate"]
+        self.ratelimit_rate = config["local_tts_429_rate"]
+        self._limiter = get_limiter("LocalTTS", config["local_tts_max_rps"])
+
+    def run(self, text: str, filepath: str, random_voice: bool = False):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+        if random_voice:
+            voice = self.randomvoice(seed)
+        else:
+            voice = settings.config["settings"]["tts"][self.voice_setting]
+        for attempt in range(self.max_retries + 1):
+            rng = random.Random(seed + attempt)
+            self._limiter.acquire()
+            time.sleep(max(0.0, rng.gauss(self.latency, self.jitter)))
+            if rng.random() < self.ratelimit_rate:
+                if attempt == self.max_retries:
+                    raise LocalTTSException(f"still ratelimited after {attempt} retries")
+                # like a real 429, every worker sharing the limiter backs off
+                self._limiter.pause(0.5 * 2**attempt)
+                continue
+            if rng.random() < self.failure_rate:
+                raise LocalTTSException("simulated failure")
+            break
+        self.save(self.synthesize(text, voice, seed), filepath)
+
+    def synthesize(self, text: str, voice: str, seed: int) -> np.ndarray:
+        """Returns mono 16 bit samples, seconds_per_char long per character of text."""
+        samples = max(1, int(len(text) * self.seconds_per_char * self.sample_rate))
+        if voice == "noise":
+            audio = np.random.default_rng(seed).uniform(-0.3, 0.3, samples)
+        else:
+            t = np.arange(samples) / self.sample_rate
+            audio = 0.3 * np.sin(2 * np.pi * (200 + seed % 400) * t)
+        # short fades so consecutive clips don't click
+        fade = min(samples // 2, self.sample_rate // 100)
+        if fade:
+            ramp = np.linspace(0.0, 1.0, fade)
+            audio[:fade] *= ramp
+            audio[-fade:] *= ramp[::-1]
+        return (audio * 32767).astype(np.int16)
+
+    def save(self, audio: np.ndarray, filepath: str):
+        partial = Path(f"{filepath}.partial")
+        if self.format == "wav":
+            with wave.open(str(partial), "wb") as out:
+                out.setnchannels(1)
+                out.setsampwidth(2)
+                out.setframerate(self.sample_rate)
+                out.writeframes(audio.tobytes())
+        else:
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-loglevel",
+                    "error",
+                    "-f",
+                    "s16le",
+                    "-ar",
+                    str(self.sample_rate),
+                    "-ac",
+                    "1",
+                    "-i",
+                    "pipe:0",
+                    "-c:a",
+                    "libmp3lame",
+                    "-b:a",
+                    "64k",
+                    "-f",
+                    "mp3",
+                    str(partial),
+                ],
+                input=audio.tobytes(),
+                capture_output=True,
+                check=True,
+            )
+        partial.replace(filepath)
+
+    def randomvoice(self, seed: int = None) -> str:
+        return random.Random(seed).choice(self.voices)
+
+
+class LocalTTSException(Exception):
+    pass
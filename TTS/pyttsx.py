@@ -1,4 +1,5 @@
 import random
+from typing import List, Tuple
 
 import pyttsx3
 
@@ -8,7 +9,15 @@ from utils import settings
 class pyttsx:
     def __init__(self):
         self.max_chars = 5000
+        self.max_concurrency = 1  # the pyttsx3 engine isn't thread safe
+        self.rate_limit = 0
+        self.voice_setting = "python_voice"
+        # queue several clips and speak them with one runAndWait, see run_many
+        self.packs_requests = settings.config["settings"]["tts"]["pyttsx_packing"]
+        self.batch_size = 50
         self.voices = []
+        self._engine = None
+        self._engine_voices = []
 
     def run(
         self,
@@ -16,27 +25,31 @@ class pyttsx:
         filepath: str,
         random_voice=False,
     ):
+        self.run_many([(text, filepath)], random_voice)
+
+    def run_many(self, jobs: List[Tuple[str, str]], random_voice: bool = False):
+        """Queues every (text, filepath) job on the engine and saves them all with one runAndWait."""
+        voice_id = self.initialize()
+        for text, filepath in jobs:
+            if random_voice:
+                voice_id = self.randomvoice()
+            self._engine.setProperty(
+                "voice", self._engine_voices[voice_id].id
+            )  # changing index changes voices but ony 0 and 1 are working here
+            self._engine.save_to_file(text, f"{filepath}")
+        self._engine.runAndWait()
+
+    def initialize(self) -> int:
+        """Starts the engine on first use and returns the configured voice index."""
         voice_id = settings.config["settings"]["tts"]["python_voice"]
         voice_num = settings.config["settings"]["tts"]["py_voice_num"]
         if voice_id == "" or voice_num == "":
-            voice_id = 2
-            voice_num = 3
             raise ValueError("set pyttsx values to a valid value, switching to defaults")
-        else:
-            voice_id = int(voice_id)
-            voice_num = int(voice_num)
-        for i in range(voice_num):
-            self.voices.append(i)
-            i = +1
-        if random_voice:
-            voice_id = self.randomvoice()
-        engine = pyttsx3.init()
-        voices = engine.getProperty("voices")
-        engine.setProperty(
-            "voice", voices[voice_id].id
-        )  # changing index changes voices but ony 0 and 1 are working here
-        engine.save_to_file(text, f"{filepath}")
-        engine.runAndWait()
+        if self._engine is None:
+            self._engine = pyttsx3.init()
+            self._engine_voices = self._engine.getProperty("voices")
+            self.voices = list(range(int(voice_num)))
+        return int(voice_id)
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -1,10 +1,14 @@
 import random
+import time
+from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import JSONDecodeError
 
 from utils import settings
-from utils.voice import check_ratelimit
+from utils.ratelimit import get_limiter
+from utils.voice import backoff_delay, retry_after
 
 voices = [
     "Brian",
@@ -32,7 +36,21 @@ class StreamlabsPolly:
     def __init__(self):
         self.url = "https://streamlabs.com/polly/speak"
         self.max_chars = 550
+        self.max_concurrency = 2
+        self.rate_limit = 1  # requests per second
+        self.voice_setting = "streamlabs_polly_voice"
+        self.paces_requests = True
         self.voices = voices
+        self.timeout = (5, 30)  # seconds to connect, seconds to read
+        self.max_retries = 5
+
+        self._session = requests.Session()
+        self._session.headers["Referer"] = "https://streamlabs.com/"
+        self._session.mount(
+            "https://", HTTPAdapter(pool_connections=2, pool_maxsize=self.max_concurrency)
+        )
+        # shared by every worker, so a 429 seen by one of them pauses all of them
+        self._limiter = get_limiter("StreamlabsPolly", self.rate_limit)
 
     def run(self, text, filepath, random_voice: bool = False):
         if random_voice:
@@ -45,23 +63,68 @@ class StreamlabsPolly:
             voice = str(settings.config["settings"]["tts"]["streamlabs_polly_voice"]).capitalize()
 
         body = {"voice": voice, "text": text, "service": "polly"}
-        headers = {"Referer": "https://streamlabs.com/"}
-        response = requests.post(self.url, headers=headers, data=body)
+        response = self._request("POST", self.url, data=body)
+        try:
+            speak_url = response.json()["speak_url"]
+        except (KeyError, JSONDecodeError):
+            try:
+                if response.json()["error"] == "No text specified!":
+                    raise ValueError("Please specify a text to convert to speech.")
+            except (KeyError, JSONDecodeError):
+                pass
+            raise StreamlabsPollyException(response.status_code, response.text[:200])
 
-        if not check_ratelimit(response):
-            self.run(text, filepath, random_voice)
+        # the audio is served from a CDN, so the download doesn't count against the ratelimit
+        voice_data = self._request("GET", speak_url, paced=False, stream=True)
+        if not voice_data.ok:
+            # an error page saved as the clip would only fail later, when it's decoded
+            with voice_data:
+                raise StreamlabsPollyException(voice_data.status_code, voice_data.text[:200])
+        partial = Path(f"{filepath}.partial")
+        with voice_data, open(partial, "wb") as f:
+            for chunk in voice_data.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+        partial.replace(filepath)
 
-        else:
+    def _request(self, method: str, url: str, paced: bool = True, **kwargs) -> requests.Response:
+        """Sends a request through the shared limiter, retrying 429s, 5xx and connection errors.
+
+        A 429 pauses the limiter for every worker for the time the server asks for (or an
+        exponential back-off), instead of each worker retrying on its own schedule.
+        """
+        for attempt in range(self.max_retries + 1):
+            if paced:
+                self._limiter.acquire()
             try:
-                voice_data = requests.get(response.json()["speak_url"])
-                with open(filepath, "wb") as f:
-                    f.write(voice_data.content)
-            except (KeyError, JSONDecodeError):
-                try:
-                    if response.json()["error"] == "No text specified!":
-                        raise ValueError("Please specify a text to convert to speech.")
-                except (KeyError, JSONDecodeError):
-                    print("Error occurred calling Streamlabs Polly")
+                response = self._session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            response.close()
+            if attempt == self.max_retries:
+                raise StreamlabsPollyException(
+                    response.status_code, f"still failing after {attempt} retries"
+                )
+            if response.status_code == 429:
+                delay = retry_after(response)
+                delay = backoff_delay(attempt, base=1.0) if delay is None else min(delay, 60.0)
+                print(f"Streamlabs Polly ratelimit hit. Pausing requests for {delay:.1f} seconds.")
+                self._limiter.pause(delay)
+            else:
+                time.sleep(backoff_delay(attempt))
 
     def randomvoice(self):
         return random.choice(self.voices)
+
+
+class StreamlabsPollyException(Exception):
+    def __init__(self, code: int, message: str):
+        self._code = code
+        self._message = message
+
+    def __str__(self) -> str:
+        return f"Streamlabs Polly failed with HTTP {self._code}: {self._message}"
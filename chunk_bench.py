@@ -0,0 +1,67 @@
+import os
+import random
+import re
+import sys
+import time
+
+# translators looks up the region over the network on import unless it's set
+os.environ.setdefault("translators_default_region", "EN")
+
+from TTS.engine_wrapper import chunk_text  # noqa: E402
+
+
+def _old_chunk_text(text: str, max_chars: int):
+    # what TTSEngine.split_post used to do
+    return [
+        x.group().strip()
+        for x in re.finditer(r" *(((.|\n){0," + str(max_chars) + r"})(\.|.$))", text)
+    ]
+
+
+def _texts(chars: int):
+    words = ["the", "landlord", "never", "fixed", "heater", "so", "we", "called", "him", "again"]
+    rng = random.Random(0)
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(5, 25))).capitalize() + "."
+
+    very_long = ""
+    while len(very_long) < chars:
+        very_long += sentence() + " "
+    no_punctuation = ""
+    while len(no_punctuation) < chars:
+        no_punctuation += rng.choice(words) + " "
+    return {
+        "long unbroken word": "a" * chars,
+        "no punctuation": no_punctuation[:chars],
+        "very long comment": very_long[:chars],
+    }
+
+
+def _time(function, *args, repeat: int = 5):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(chars: int = 20000, max_chars: int = 550):
+    """Times chunk_text and the old regex split on texts that used to be slow or lose text."""
+    print(f"{chars} chars, max_chars={max_chars}, best of 5")
+    for name, text in _texts(chars).items():
+        new, chunks = _time(chunk_text, text, max_chars)
+        old, old_chunks = _time(_old_chunk_text, text, max_chars)
+        # count the characters that aren't whitespace, the chunks join words with one space
+        kept = len("".join("".join(old_chunks).split())) / len("".join(text.split()))
+        print(f"{name}:")
+        print(f"  chunk_text: {new * 1000:8.2f}ms, {len(chunks)} chunks")
+        print(
+            f"  old regex:  {old * 1000:8.2f}ms, {len(old_chunks)} chunks,"
+            f" {kept:.0%} of the text kept"
+        )
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:3]))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import math
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from os import name
 from pathlib import Path
 from subprocess import Popen
@@ -12,6 +13,7 @@ from playwright.sync_api import sync_playwright
 
 from reddit.subreddit import get_subreddit_threads
 from utils import settings
+from utils.background_index import update_index
 from utils.cleanup import cleanup
 from utils.console import print_markdown, print_step, print_substep
 from utils.ffmpeg_install import ffmpeg_install
@@ -21,11 +23,16 @@ from video_creation.background import (
     chop_background,
     download_background_audio,
     download_background_video,
+    fit_background,
     get_background_config,
 )
-from video_creation.final_video import make_final_video
+from video_creation.final_video import (
+    get_audio_clip_names,
+    make_final_video,
+    narration_gap,
+)
 from video_creation.screenshot_downloader import get_screenshots_of_reddit_posts
-from video_creation.voices import save_text_to_mp3
+from video_creation.voices import estimate_length, save_text_to_mp3
 
 __VERSION__ = "3.3.0"
 
@@ -49,6 +56,25 @@ def main(POST_ID=None) -> None:
     global redditid, reddit_object
     reddit_object = get_subreddit_threads(POST_ID)
     redditid = id(reddit_object)
+
+    # Background config
+    bg_config = {
+        "video": ("local", "Minecraft.mp4", "test", "center"),
+        "audio": ("local", "no-audio.mp3", "none")
+    }
+    
+    settings.config["settings"]["background"]["background_audio_volume"] = 0
+
+    background = None
+    if settings.config["settings"]["background"]["speculative_background"]:
+        # prepare the background for an estimated length while the TTS runs
+        estimated_length = math.ceil(
+            estimate_length(reddit_object)
+            * settings.config["settings"]["background"]["speculative_background_margin"]
+        )
+        executor = ThreadPoolExecutor(max_workers=1)
+        background = executor.submit(chop_background, bg_config, estimated_length, reddit_object)
+        executor.shutdown(wait=False)
     
     # Get content length and number of comments
     length, number_of_comments = save_text_to_mp3(reddit_object)
@@ -56,20 +82,19 @@ def main(POST_ID=None) -> None:
     
     # Limit number of comments to 5 (0 through 4)
     number_of_comments = min(number_of_comments, 5)
+    # the audio engine may put silence between the clips make_final_video joins
+    gaps = len(get_audio_clip_names(number_of_comments)) - 1
+    length = math.ceil(length + narration_gap() * gaps)
     print_step(f"Processing {number_of_comments} comments")
     
     get_screenshots_of_reddit_posts(reddit_object, number_of_comments)
     
-    # Background config
-    bg_config = {
-        "video": ("local", "Minecraft.mp4", "test", "center"),
-        "audio": ("local", "no-audio.mp3", "none")
-    }
-    
-    settings.config["settings"]["background"]["background_audio_volume"] = 0
-    
     length = 10  # DEBUG: Force video to 10 seconds
-    chop_background(bg_config, length, reddit_object)
+    if background is not None:
+        background.result()
+        fit_background(bg_config, estimated_length, length, reddit_object)
+    else:
+        chop_background(bg_config, length, reddit_object)
     make_final_video(number_of_comments, length, reddit_object, bg_config)
 
 
@@ -103,6 +128,8 @@ if __name__ == "__main__":
         f"{directory}/utils/.config.template.toml", f"{directory}/config.toml"
     )
     config is False and sys.exit()
+    # index backgrounds that were added, replaced or removed since the last run
+    update_index()
 
     if (
         not settings.config["settings"]["tts"]["tiktok_sessionid"]
@@ -1,10 +1,53 @@
+import sys
+import tempfile
+import time
+
 import pyttsx3
 
-engine = pyttsx3.init()
-voices = engine.getProperty("voices")
-for voice in voices:
-    print(voice, voice.id)
-    engine.setProperty("voice", voice.id)
-    engine.say("Hello World!")
+
+def list_voices():
+    engine = pyttsx3.init()
+    voices = engine.getProperty("voices")
+    for voice in voices:
+        print(voice, voice.id)
+        engine.setProperty("voice", voice.id)
+        engine.say("Hello World!")
+        engine.runAndWait()
+        engine.stop()
+
+
+def _save_one(text: str, filepath: str):
+    # what TTS/pyttsx.py used to do for every clip
+    engine = pyttsx3.init()
+    voices = engine.getProperty("voices")
+    engine.setProperty("voice", voices[0].id)
+    engine.save_to_file(text, filepath)
     engine.runAndWait()
-    engine.stop()
+
+
+def benchmark(clips: int = 20):
+    """Compares saving clips one engine per clip (the old path) with one batched runAndWait."""
+    texts = [f"This is comment number {i}, read out by the offline voice." for i in range(clips)]
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for i, text in enumerate(texts):
+            _save_one(text, f"{directory}/single-{i}.mp3")
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine = pyttsx3.init()
+        engine.setProperty("voice", engine.getProperty("voices")[0].id)
+        for i, text in enumerate(texts):
+            engine.save_to_file(text, f"{directory}/batch-{i}.mp3")
+        engine.runAndWait()
+        batch = time.perf_counter() - start
+
+    print(f"{clips} clips, one engine per clip: {single:.2f}s ({single / clips * 1000:.0f}ms/clip)")
+    print(f"{clips} clips, one runAndWait: {batch:.2f}s ({batch / clips * 1000:.0f}ms/clip)")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["benchmark"]:
+        benchmark(*map(int, sys.argv[2:3]))
+    else:
+        list_voices()
@@ -0,0 +1,32 @@
+import os
+import sys
+from pathlib import Path
+
+# translators looks up the region over the network on import unless it's set
+os.environ.setdefault("translators_default_region", "EN")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import pytest  # noqa: E402
+import toml  # noqa: E402
+
+from utils import settings  # noqa: E402
+
+
+def template_defaults(node: dict) -> dict:
+    """The config utils/settings.check_toml would build from the template's defaults."""
+    if "optional" in node:
+        return node.get("default")
+    return {key: template_defaults(value) for key, value in node.items()}
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """Default settings.config, with the working directory in a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    config = template_defaults(toml.load(ROOT / "utils" / ".config.template.toml"))
+    config["settings"]["tts"]["random_voice"] = False
+    config["reddit"]["thread"]["post_lang"] = ""
+    monkeypatch.setattr(settings, "config", config)
+    return config
@@ -0,0 +1,101 @@
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from utils.audio import AudioProbeError, _mp3_frame, get_audio_info
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def frames(count: int, sample_rate: int) -> float:
+    """Seconds of count MP3 frames. Encoders add up to about three frames of delay and padding."""
+    return count * (1152 if sample_rate >= 32000 else 576) / sample_rate
+
+
+def encode(path, seconds: float, *args: str, sample_rate: int = 44100, channels: int = 1):
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=duration={seconds}"]
+        + ["-ar", str(sample_rate), "-ac", str(channels), *args, str(path)],
+        check=True,
+    )
+    return path
+
+
+def test_mp3_frame_header():
+    # MPEG-1 layer III, 128 kbps, 44.1 kHz, no padding, joint stereo
+    frame = _mp3_frame(struct.pack(">I", 0xFFFB9044), 0)
+    assert (frame.length, frame.samples, frame.sample_rate, frame.channels) == (417, 1152, 44100, 2)
+    # MPEG-2 layer III, 64 kbps, 22.05 kHz, padding, mono
+    frame = _mp3_frame(struct.pack(">I", 0xFFF382C0), 0)
+    assert (frame.length, frame.samples, frame.sample_rate, frame.channels) == (209, 576, 22050, 1)
+    # the reserved version and bitrate "bad" aren't frames
+    assert _mp3_frame(struct.pack(">I", 0xFFEB9044), 0) is None
+    assert _mp3_frame(struct.pack(">I", 0xFFFBF044), 0) is None
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["-b:a", "128k"],  # CBR with an Info header
+        ["-q:a", "4"],  # VBR with a Xing header
+        ["-b:a", "128k", "-write_xing", "0"],  # no header, the frames are counted
+        ["-q:a", "4", "-write_xing", "0"],
+    ],
+    ids=["cbr", "vbr-xing", "cbr-no-xing", "vbr-no-xing"],
+)
+def test_mp3(tmp_path, args):
+    info = get_audio_info(encode(tmp_path / "clip.mp3", 3.0, *args, channels=2))
+
+    assert info.duration == pytest.approx(3.0, abs=frames(3, 44100))
+    assert (info.sample_rate, info.channels, info.codec) == (44100, 2, "mp3")
+
+
+@pytest.mark.parametrize("sample_rate", [24000, 22050, 16000, 12000, 11025, 8000])
+@pytest.mark.parametrize("xing", ["1", "0"])
+def test_mpeg2_and_mpeg25_mono(tmp_path, sample_rate, xing):
+    path = encode(tmp_path / "clip.mp3", 2.0, "-write_xing", xing, sample_rate=sample_rate)
+
+    info = get_audio_info(path)
+
+    assert info.duration == pytest.approx(2.0, abs=frames(3, sample_rate))
+    assert (info.sample_rate, info.channels) == (sample_rate, 1)
+
+
+def test_naively_concatenated_mp3s(tmp_path):
+    # the Info header of the first part only covers the first part
+    first = encode(tmp_path / "first.mp3", 1.0, "-b:a", "64k")
+    second = encode(tmp_path / "second.mp3", 2.0, "-b:a", "64k")
+    joined = tmp_path / "joined.mp3"
+    joined.write_bytes(first.read_bytes() + second.read_bytes())
+
+    assert get_audio_info(joined).duration == pytest.approx(3.0, abs=frames(6, 44100))
+
+
+def test_wav(tmp_path):
+    info = get_audio_info(encode(tmp_path / "clip.wav", 1.5, sample_rate=24000))
+
+    assert info == (1.5, 24000, 1, "pcm_s16le")
+
+
+def test_streamed_wav(tmp_path):
+    # written to a pipe, ffmpeg can't go back and fill in the data size
+    path = tmp_path / "clip.wav"
+    with open(path, "wb") as pipe:
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=duration=1.5"]
+            + ["-ac", "2", "-c:a", "pcm_f32le", "-f", "wav", "pipe:1"],
+            stdout=pipe,
+            check=True,
+        )
+    assert struct.unpack_from("<I", path.read_bytes(), 4)[0] == 0xFFFFFFFF
+
+    assert get_audio_info(path) == (1.5, 44100, 2, "pcm_f32le")
+
+
+def test_empty_file(tmp_path):
+    (tmp_path / "clip.mp3").write_bytes(b"")
+
+    with pytest.raises(AudioProbeError):
+        get_audio_info(tmp_path / "clip.mp3")
@@ -0,0 +1,113 @@
+import io
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from TTS import aws_polly  # noqa: E402
+from TTS.aws_polly import AWSPolly  # noqa: E402
+from TTS.engine_wrapper import TTSEngine  # noqa: E402
+from utils.audio import get_duration, split_mp3  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+# every text takes a second to speak, and the packed SSML puts a 250ms break between texts
+TEXT_SECONDS = 1.0
+BREAK_SECONDS = 0.25
+
+
+def sine_mp3(seconds: float) -> bytes:
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=duration={seconds}"]
+        + ["-c:a", "libmp3lame", "-f", "mp3", "pipe:1"],
+        capture_output=True,
+        check=True,
+    ).stdout
+
+
+class FakePolly:
+    """Answers synthesize_speech like Polly, with speech marks at the <mark>s of packed SSML."""
+
+    def __init__(self, audio_texts: int = None):
+        self.requests = []
+        # how many texts of a pack the returned audio covers, to simulate short audio
+        self.audio_texts = audio_texts
+
+    def synthesize_speech(self, Engine, Text, OutputFormat, VoiceId, TextType="text", **kwargs):
+        self.requests.append((TextType, OutputFormat, Text))
+        marks = re.findall(r'<mark name="(\d+)"/>', Text) if TextType == "ssml" else ["0"]
+        if OutputFormat == "json":
+            lines = [
+                json.dumps({"time": int(i * (TEXT_SECONDS + BREAK_SECONDS) * 1000), "value": mark})
+                for i, mark in enumerate(marks)
+            ]
+            return {"AudioStream": io.BytesIO("\n".join(lines).encode())}
+        texts = len(marks) if self.audio_texts is None else min(self.audio_texts, len(marks))
+        seconds = texts * TEXT_SECONDS + (texts - 1) * BREAK_SECONDS
+        return {"AudioStream": io.BytesIO(sine_mp3(seconds))}
+
+
+@pytest.fixture
+def polly(config, monkeypatch):
+    config["settings"]["tts"]["aws_polly_packing"] = True
+    fake = FakePolly()
+    monkeypatch.setattr(aws_polly, "get_polly_client", lambda *args: fake)
+    return fake
+
+
+def test_run_many_packs_clips_into_one_request(polly, tmp_path):
+    jobs = [(f"Comment number {i}.", str(tmp_path / f"{i}.mp3")) for i in range(5)]
+
+    AWSPolly().run_many(jobs)
+
+    assert [(kind, output) for kind, output, _ in polly.requests] == [
+        ("ssml", "json"),
+        ("ssml", "mp3"),
+    ]
+    durations = [get_duration(path) for _, path in jobs]
+    expected = [TEXT_SECONDS + BREAK_SECONDS] * 4 + [TEXT_SECONDS]
+    assert durations == pytest.approx(expected, abs=0.06)  # one MP3 frame is 26ms
+
+
+def test_packs_stay_within_max_chars(polly, tmp_path):
+    module = AWSPolly()
+    module.max_chars = 25
+    jobs = [(f"Comment {i}.", str(tmp_path / f"{i}.mp3")) for i in range(5)]  # 11 chars each
+
+    module.run_many(jobs)
+
+    assert len(polly.requests) == 6  # packs of 2, 2 and 1 clips
+    assert all(get_duration(path) > 0 for _, path in jobs)
+
+
+def test_split_mp3_returns_empty_parts_past_the_end():
+    parts = split_mp3(sine_mp3(1.0), [0.5, 2.0, 3.0])
+
+    assert len(parts) == 4
+    assert parts[0] and parts[1]
+    assert parts[2:] == [b"", b""]
+
+
+def test_save_batch_synthesizes_clips_missing_from_a_pack(polly):
+    polly.audio_texts = 2  # the audio ends after the second of four texts
+    comments = [{"comment_body": f"Comment number {i}."} for i in range(4)]
+    engine = TTSEngine(AWSPolly, {"thread_id": "abc", "thread_title": "Title", "comments": comments})
+    Path(engine.path).mkdir(parents=True)
+
+    durations = engine.save_batch([(f"{i}", f"Comment number {i}.", True) for i in range(4)])
+
+    assert len(durations) == 4
+    assert all(duration > 0 for duration in durations)
+    # the pack, then one plain request for each of the two missing clips
+    assert [(kind, output) for kind, output, _ in polly.requests] == [
+        ("ssml", "json"),
+        ("ssml", "mp3"),
+        ("text", "mp3"),
+        ("text", "mp3"),
+    ]
+    assert sorted(engine.clips) == ["0", "1", "2", "3"]
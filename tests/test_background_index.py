@@ -0,0 +1,47 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils import background_index
+from utils.background_index import INDEX_PATH, update_index
+
+
+def entry(path: str) -> dict:
+    return {"path": path, "size": 1, "mtime": 0.0, "duration": 1.0, "codec": "h264"}
+
+
+def test_index_saved_by_many_writers(config):
+    # like render processes starting together, each saving the entries it probed
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for future in [
+            pool.submit(background_index._save_index, {f"video-{i}.mp4": entry(f"video-{i}.mp4")})
+            for i in range(100)
+        ]:
+            future.result()
+
+    index = json.loads(Path(INDEX_PATH).read_text())
+    assert index and all(path == value["path"] for path, value in index.items())
+    assert list(Path(INDEX_PATH).parent.glob("*.partial")) == []
+
+
+def test_saves_keep_entries_of_other_writers(config):
+    background_index._save_index({"first.mp4": entry("first.mp4")})
+    background_index._save_index({"second.mp4": entry("second.mp4")})
+
+    assert sorted(json.loads(Path(INDEX_PATH).read_text())) == ["first.mp4", "second.mp4"]
+
+
+def test_update_index_drops_deleted_files(config):
+    Path("kept.mp4").write_bytes(b"")
+    background_index._save_index({"kept.mp4": entry("kept.mp4"), "gone.mp4": entry("gone.mp4")})
+
+    assert list(update_index("assets/backgrounds")) == ["kept.mp4"]
+    assert list(json.loads(Path(INDEX_PATH).read_text())) == ["kept.mp4"]
+
+
+def test_index_errors_are_ignored(config):
+    Path("assets").write_text("")  # the index directory can't be created
+
+    index = background_index._save_index({"video.mp4": entry("video.mp4")})
+
+    assert list(index) == ["video.mp4"]
@@ -0,0 +1,105 @@
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from TTS.engine_wrapper import TTSEngine  # noqa: E402
+from TTS.failover import LatencyStats, ProviderChain  # noqa: E402
+from TTS.local import LocalTTS  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+class Primary(LocalTTS):
+    down = False
+    runs = 0
+
+    def run(self, text, filepath, random_voice=False):
+        type(self).runs += 1
+        if self.down:
+            raise RuntimeError("outage")
+        super().run(text, filepath, random_voice)
+
+
+class Backup(LocalTTS):
+    pass
+
+
+@pytest.fixture
+def engine(config, tmp_path):
+    config["settings"]["tts"]["tts_cache"] = True
+    config["settings"]["tts"]["local_tts_latency"] = 0
+    config["settings"]["tts"]["local_tts_jitter"] = 0
+    Primary.down, Primary.runs = False, 0
+    chain = partial(ProviderChain, [Primary, Backup], stats=LatencyStats(tmp_path / "latency.json"))
+    engine = TTSEngine(chain, {"thread_id": "abc", "thread_title": "Title", "comments": []})
+    Path(engine.path).mkdir(parents=True)
+    return engine
+
+
+def cached_clips() -> list:
+    return list(Path("assets/tts_cache").glob("*/*.mp3"))
+
+
+def test_clips_of_the_primary_provider_are_cached(engine):
+    engine.call_tts("0", "Hello there.")
+    engine.call_tts("1", "Hello there.")
+
+    assert Primary.runs == 1
+    assert len(cached_clips()) == 1
+
+
+def test_clips_of_a_fallback_provider_are_not_cached(engine):
+    Primary.down = True
+    engine.call_tts("0", "Hello there.")
+
+    assert cached_clips() == []
+    assert Path(engine.clip_path("0")).stat().st_size > 0
+
+    # once the primary is back, the clip is made in its voice
+    Primary.down = False
+    engine.call_tts("1", "Hello there.")
+
+    assert Primary.runs == 2
+    assert len(cached_clips()) == 1
+
+
+def test_latency_stats_saved_by_many_writers(tmp_path):
+    path = tmp_path / "latency.json"
+    writers = [LatencyStats(path) for _ in range(4)]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for _ in range(50):
+            for i, stats in enumerate(writers):
+                pool.submit(stats.record, f"Provider{i}", 0.1)
+
+    # every save replaced the file whole, so it is one writer's complete stats
+    assert len(json.loads(path.read_text())) == 1
+    assert list(tmp_path.glob("*.partial")) == []
+
+
+def test_latency_stats_errors_dont_fail_the_request(tmp_path):
+    (tmp_path / "file").write_text("")
+    stats = LatencyStats(tmp_path / "file" / "latency.json")  # can't be created
+
+    stats.record("Provider", 0.1)
+
+    assert stats.percentile("Provider", 50, min_samples=1) == 0.1
+
+
+def test_chains_with_different_primaries_have_different_cache_keys(config, tmp_path):
+    config["settings"]["tts"]["random_voice"] = True
+    stats = LatencyStats(tmp_path / "latency.json")
+    reddit_object = {"thread_id": "abc", "thread_title": "Title", "comments": []}
+    first = TTSEngine(partial(ProviderChain, [Primary, Backup], stats=stats), reddit_object)
+    second = TTSEngine(partial(ProviderChain, [Backup, Primary], stats=stats), reddit_object)
+    alone = TTSEngine(Primary, reddit_object)
+
+    assert first.cache_key("Hello") != second.cache_key("Hello")
+    # the chain caches clips of its primary, so they are the same as the primary's own
+    assert first.cache_key("Hello") == alone.cache_key("Hello")
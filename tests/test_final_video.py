@@ -0,0 +1,54 @@
+import shutil
+
+import ffmpeg
+import pytest
+
+final_video = pytest.importorskip("video_creation.final_video")
+
+
+@pytest.mark.parametrize(
+    "storymode, method, names",
+    [
+        (False, 0, ["title", "0", "1", "2"]),
+        (True, 0, ["title", "postaudio"]),
+        (True, 1, ["title", "postaudio-0", "postaudio-1", "postaudio-2", "postaudio-3"]),
+    ],
+)
+def test_audio_clip_names(config, storymode, method, names):
+    config["settings"]["storymode"] = storymode
+    config["settings"]["storymodemethod"] = method
+
+    assert final_video.get_audio_clip_names(3) == names
+
+
+@pytest.mark.parametrize("engine, gap", [("numpy", 0.3), ("ffmpeg", 0.0)])
+def test_narration_gap(config, engine, gap):
+    config["settings"]["audio_engine"] = engine
+    config["settings"]["tts"]["silence_duration"] = 0.3
+
+    assert final_video.narration_gap() == gap
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+@pytest.mark.parametrize(
+    "width, height", [(1920, 1080), (1280, 720), (1280, 721), (854, 480), (1080, 1920)]
+)
+def test_cropped_size_is_what_ffmpeg_crops_to(tmp_path, width, height):
+    W, H = 1080, 1920
+    output = tmp_path / "frame.y4m"
+    (
+        ffmpeg.input(f"testsrc=size={width}x{height}:duration=0.04", f="lavfi")
+        .filter("format", "yuv420p")  # like the background videos
+        .filter("crop", f"ih*({W}/{H})", "ih")
+        .output(str(output), frames=1)
+        .run(quiet=True)
+    )
+    header = output.read_bytes().split(b"\n", 1)[0].split()
+
+    assert (int(header[1][1:]), int(header[2][1:])) == final_video.get_cropped_size(
+        width, height, W, H
+    )
+
+
+def test_cropped_size_of_a_proxy():
+    assert final_video.get_cropped_size(1080, 1920, 1080, 1920) == (1080, 1920)
@@ -0,0 +1,51 @@
+import shutil
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from TTS.engine_wrapper import TTSEngine  # noqa: E402
+from TTS.local import LocalTTS, LocalTTSException  # noqa: E402
+from utils import ratelimit  # noqa: E402
+from utils.audio import get_audio_info  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+@pytest.fixture
+def local_config(config):
+    config["settings"]["tts"]["local_tts_latency"] = 0
+    config["settings"]["tts"]["local_tts_jitter"] = 0
+    return config
+
+
+@pytest.mark.parametrize("local_format", ["mp3", "wav"])
+@pytest.mark.parametrize("intermediate_format", ["mp3", "wav"])
+def test_long_comments_are_split_and_joined(local_config, local_format, intermediate_format):
+    local_config["settings"]["tts"]["local_tts_format"] = local_format
+    local_config["settings"]["tts"]["intermediate_format"] = intermediate_format
+    text = "This comment is far too long for a single request. " * 20  # > max_chars
+    engine = TTSEngine(LocalTTS, {"thread_id": "abc", "thread_title": "Title", "comments": []})
+    engine.run()
+
+    length = engine.save_clip("0", text)
+
+    info = get_audio_info(engine.clip_path("0"))
+    assert info.duration == pytest.approx(length, abs=0.5)
+    assert length > len(text) * engine.tts_module.seconds_per_char * 0.9
+
+
+def test_simulated_429_delays_the_retry(local_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(ratelimit, "_limiters", {})  # a bucket of its own, in tmp_path
+    local_config["settings"]["tts"]["local_tts_429_rate"] = 1
+    module = LocalTTS()
+    module.max_retries = 1
+
+    start = time.perf_counter()
+    with pytest.raises(LocalTTSException, match="ratelimited"):
+        module.run("Hello there.", str(tmp_path / "clip.mp3"))
+
+    # the first 429 pauses the limiter for 0.5s before the retry, with no rate limit set
+    assert local_config["settings"]["tts"]["local_tts_max_rps"] == 0
+    assert time.perf_counter() - start >= 0.45
@@ -0,0 +1,118 @@
+import shutil
+import subprocess
+import wave
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils import mixer  # noqa: E402
+from utils.audio import CANONICAL_SAMPLE_RATE as RATE  # noqa: E402
+from utils.mixer import assemble, decode  # noqa: E402
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def write_wav(path: str, value: float, seconds: float) -> str:
+    """A canonical WAV of seconds of a constant sample value."""
+    samples = np.full(int(seconds * RATE), round(value * 32767), dtype="<i2")
+    with wave.open(path, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(RATE)
+        clip.writeframes(samples.tobytes())
+    return path
+
+
+def read(path: str) -> np.ndarray:
+    return decode(path)[:, 0]
+
+
+def at(samples: np.ndarray, seconds: float) -> float:
+    return float(samples[int(seconds * RATE)])
+
+
+def test_clips_are_joined_with_gaps(tmp_path):
+    clips = [write_wav(str(tmp_path / f"{i}.wav"), 0.5, 0.5) for i in range(3)]
+
+    result = assemble(clips, str(tmp_path / "narration.wav"), gap=0.25)
+
+    assert result.offsets == pytest.approx([0.0, 0.75, 1.5])
+    assert result.duration == pytest.approx(2.0)
+    narration = read(str(tmp_path / "narration.wav"))
+    assert len(narration) == int(2.0 * RATE)
+    assert at(narration, 0.25) == pytest.approx(0.5, abs=1e-3)
+    assert at(narration, 0.6) == 0  # the gap is silent
+    assert at(narration, 1.0) == pytest.approx(0.5, abs=1e-3)
+
+
+def test_clips_in_other_formats_are_decoded(tmp_path):
+    mp3 = str(tmp_path / "clip.mp3")
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=r=24000:duration=1", mp3],
+        check=True,
+    )
+    wav = write_wav(str(tmp_path / "clip.wav"), 0.5, 0.5)
+
+    result = assemble([mp3, wav], str(tmp_path / "narration.wav"))
+
+    # an MP3 decoder may add a few frames of padding
+    assert result.offsets[1] == pytest.approx(1.0, abs=0.06)
+    assert result.duration == pytest.approx(1.5, abs=0.06)
+
+
+def test_background_is_ducked_under_speech(tmp_path):
+    clips = [write_wav(str(tmp_path / f"{i}.wav"), 0.5, 1.0) for i in range(2)]
+    background = write_wav(str(tmp_path / "background.wav"), 0.2, 10.0)
+
+    assemble(
+        clips,
+        str(tmp_path / "narration.wav"),
+        gap=1.0,
+        background=background,
+        background_start=2.0,
+        background_volume=0.5,
+        ducking=0.5,
+        mixed_output=str(tmp_path / "mixed.wav"),
+    )
+
+    mixed = read(str(tmp_path / "mixed.wav"))
+    assert len(mixed) == int(3.0 * RATE)
+    # under speech the background is at volume * ducking, in the gap at volume
+    assert at(mixed, 0.5) == pytest.approx(0.5 + 0.2 * 0.5 * 0.5, abs=2e-3)
+    assert at(mixed, 1.5) == pytest.approx(0.2 * 0.5, abs=2e-3)
+    assert at(mixed, 2.5) == pytest.approx(0.5 + 0.2 * 0.5 * 0.5, abs=2e-3)
+
+
+def test_no_ducking(tmp_path):
+    clips = [write_wav(str(tmp_path / "0.wav"), 0.5, 1.0)]
+    background = write_wav(str(tmp_path / "background.wav"), 0.2, 1.0)
+
+    assemble(
+        clips,
+        str(tmp_path / "narration.wav"),
+        background=background,
+        background_volume=0.5,
+        mixed_output=str(tmp_path / "mixed.wav"),
+    )
+
+    assert at(read(str(tmp_path / "mixed.wav")), 0.5) == pytest.approx(0.6, abs=2e-3)
+
+
+def test_memory_mapped_buffer_grows_past_the_estimate(tmp_path, monkeypatch):
+    monkeypatch.setattr(mixer, "MEMMAP_SECONDS", 0)
+    # clips longer than their headers say, like MP3s that decode to more frames
+    get_audio_info = mixer.get_audio_info
+    monkeypatch.setattr(
+        mixer, "get_audio_info", lambda path: get_audio_info(path)._replace(duration=0.01)
+    )
+    clips = [write_wav(str(tmp_path / f"{i}.wav"), 0.25 * (i + 1), 1.0) for i in range(3)]
+    scratch = tmp_path / "scratch"
+
+    result = assemble(clips, str(tmp_path / "narration.wav"), scratch_dir=str(scratch))
+
+    assert result.duration == pytest.approx(3.0)
+    narration = read(str(tmp_path / "narration.wav"))
+    assert [at(narration, t) for t in (0.5, 1.5, 2.5)] == pytest.approx([0.25, 0.5, 0.75], abs=1e-3)
+    # the buffer was a scratch file, and it is removed afterwards
+    assert scratch.is_dir() and list(scratch.iterdir()) == []
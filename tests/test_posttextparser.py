@@ -0,0 +1,81 @@
+import pytest
+
+from utils.posttextparser import rule_based_sentences, strip_markdown
+
+# plain prose, so spaCy and the rules see the same text
+CORPUS = [
+    "I moved to a new city last year. It was hard at first! Now I love it.",
+    "My landlord, Mr. Jones, never fixed the heater. We called him every day for a month. "
+    "He finally sent someone in Dec. 2021.",
+    "She said no. Then she left without another word.",
+    "We packed tents, food, water, etc. Then we drove for six hours.",
+    "Dr. Patel told me to rest. I didn't listen. That was a mistake.",
+    "The price went from 3.5 dollars to 7.25 dollars. Nobody could explain why.",
+    "Was I wrong? My sister thinks so. My parents think I'm right.",
+    "I waited... and waited. Nobody came. Eventually I went home.",
+    'He looked at me and said "you should go." So I went.',
+    "It happened at No. 4 Elm Street. The house is still empty today.",
+]
+
+
+@pytest.mark.parametrize(
+    "text, sentences",
+    [
+        ("She said no. Then she left.", ["She said no.", "Then she left."]),
+        ("It was No. 5 on the list.", ["It was No. 5 on the list."]),
+        ("We ate, drank, etc. Then we slept.", ["We ate, drank, etc.", "Then we slept."]),
+        ("They sent it in Mar. 2020 to me.", ["They sent it in Mar. 2020 to me."]),
+        ("It rained all of Mar. Then it stopped.", ["It rained all of Mar.", "Then it stopped."]),
+        ("Dr. Smith lives on St. Mary road.", ["Dr. Smith lives on St. Mary road."]),
+        ("Ask Mr. Brown. He knows.", ["Ask Mr. Brown.", "He knows."]),
+        ("It costs 3.50 now. Wow!", ["It costs 3.50 now.", "Wow!"]),
+        ("J. R. R. Tolkien wrote it.", ["J. R. R. Tolkien wrote it."]),
+        ("Wait... What? Really.", ["Wait...", "What?", "Really."]),
+    ],
+)
+def test_rule_based_sentences(text, sentences):
+    assert rule_based_sentences(text) == sentences
+
+
+def test_headings_are_blocks_of_their_own():
+    assert strip_markdown("# Title\nFirst line of body.\nSecond line.") == [
+        "Title",
+        "First line of body. Second line.",
+    ]
+
+
+def test_markdown_is_removed():
+    text = "Some **bold** and [a link](https://example.com).\n\n* item one\n* item two\n> quote"
+    assert strip_markdown(text) == [
+        "Some bold and a link.",
+        "item one",
+        "item two",
+        "quote",
+    ]
+
+
+def _boundaries(sentences):
+    """Character offsets of sentence ends in the text with all whitespace removed."""
+    offsets, position = set(), 0
+    for sentence in sentences:
+        position += len("".join(sentence.split()))
+        offsets.add(position)
+    return offsets
+
+
+def test_rules_agree_with_spacy():
+    spacy = pytest.importorskip("spacy")
+    try:
+        nlp = spacy.load("en_core_web_sm")
+    except OSError:
+        pytest.skip("the spaCy model en_core_web_sm isn't installed")
+
+    found = expected = agreed = 0
+    for text in CORPUS:
+        rules = _boundaries(rule_based_sentences(text))
+        reference = _boundaries(sentence.text for sentence in nlp(text).sents)
+        found += len(rules)
+        expected += len(reference)
+        agreed += len(rules & reference)
+    precision, recall = agreed / found, agreed / expected
+    assert 2 * precision * recall / (precision + recall) >= 0.9
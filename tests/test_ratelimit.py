@@ -0,0 +1,67 @@
+import pytest
+
+from utils import ratelimit
+from utils.ratelimit import RateLimiter, SharedRateLimiter, get_limiter, limiter_metrics
+
+
+@pytest.fixture
+def limiters(tmp_path, monkeypatch):
+    """Limiters with buckets in a temporary directory, and none cached from other tests."""
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    return lambda key, rate, **kwargs: SharedRateLimiter(key, rate, directory=tmp_path, **kwargs)
+
+
+@pytest.mark.parametrize("rate", [0, 1000])
+def test_pause_holds_back_callers(limiters, rate):
+    limiter = limiters("Provider", rate)
+    limiter.acquire()
+
+    limiter.pause(0.3)
+
+    assert limiter.acquire() == pytest.approx(0.3, abs=0.05)
+
+
+@pytest.mark.parametrize("rate", [0, 1000])
+def test_pause_of_the_in_process_limiter(rate):
+    limiter = RateLimiter(rate)
+    limiter.acquire()
+
+    limiter.pause(0.3)
+
+    assert limiter.acquire() == pytest.approx(0.3, abs=0.05)
+
+
+def test_calls_are_spaced_by_the_rate(limiters):
+    limiter = limiters("Provider", 10)
+
+    waits = [limiter.acquire() for _ in range(3)]
+
+    # the bucket starts with one token, then refills one every 0.1s
+    assert waits[0] == 0
+    assert waits[1:] == pytest.approx([0.1, 0.1], abs=0.02)
+
+
+def test_processes_share_a_bucket(limiters):
+    first, second = limiters("Provider", 10), limiters("Provider", 10)
+    other = limiters("Other", 10)
+
+    first.acquire()
+
+    assert second.acquire() == pytest.approx(0.1, abs=0.02)
+    assert other.acquire() == 0
+    second.pause(0.2)
+    assert first.acquire() == pytest.approx(0.2, abs=0.03)
+
+
+def test_wait_metrics(limiters, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    limiter = get_limiter("Provider", 10)
+    for _ in range(3):
+        limiter.acquire()
+
+    metrics = limiter_metrics()["Provider"]
+
+    assert metrics["calls"] == 3
+    assert metrics["waits"] == 2
+    assert metrics["wait_total"] == pytest.approx(0.2, abs=0.03)
+    assert metrics["wait_max"] == pytest.approx(0.1, abs=0.02)
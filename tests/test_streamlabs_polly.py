@@ -0,0 +1,42 @@
+import io
+
+import pytest
+import requests
+
+from TTS.streamlabs_polly import StreamlabsPolly, StreamlabsPollyException
+
+
+def response(status: int, content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO(content)
+    return response
+
+
+@pytest.fixture
+def polly(config, monkeypatch):
+    module = StreamlabsPolly()
+    replies = {
+        "POST": response(200, b'{"speak_url": "https://cdn.example.com/clip.mp3"}'),
+        "GET": response(403, b"<Error>AccessDenied</Error>"),
+    }
+    monkeypatch.setattr(module, "_request", lambda method, url, **kwargs: replies[method])
+    return module, replies
+
+
+def test_failed_download_raises(polly, tmp_path):
+    module, _ = polly
+
+    with pytest.raises(StreamlabsPollyException, match="HTTP 403"):
+        module.run("Hello there.", str(tmp_path / "clip.mp3"))
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_is_saved(polly, tmp_path):
+    module, replies = polly
+    replies["GET"] = response(200, b"ID3 audio")
+
+    module.run("Hello there.", str(tmp_path / "clip.mp3"))
+
+    assert (tmp_path / "clip.mp3").read_bytes() == b"ID3 audio"
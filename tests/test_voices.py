@@ -0,0 +1,26 @@
+import pytest
+
+from TTS.engine_wrapper import CHARS_PER_SECOND, DEFAULT_MAX_LENGTH
+from video_creation.voices import estimate_length
+
+LONG_TEXT = "x" * (CHARS_PER_SECOND * DEFAULT_MAX_LENGTH * 3)
+
+
+def test_comments_are_estimated_up_to_the_max_length(config):
+    config["settings"]["storymode"] = False
+    reddit_object = {
+        "thread_title": "Title",
+        "comments": [{"comment_body": "Short comment."}, {"comment_body": LONG_TEXT}],
+    }
+
+    assert estimate_length(reddit_object) == DEFAULT_MAX_LENGTH
+
+
+@pytest.mark.parametrize("post", [LONG_TEXT, [LONG_TEXT[:100], LONG_TEXT[100:]]])
+def test_stories_are_estimated_in_full(config, post):
+    config["settings"]["storymode"] = True
+    reddit_object = {"thread_title": "Title", "thread_post": post}
+
+    assert estimate_length(reddit_object) == pytest.approx(
+        (len("Title") + len(LONG_TEXT)) / CHARS_PER_SECOND
+    )
@@ -0,0 +1,342 @@
+import json
+import struct
+import subprocess
+import wave
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+# kbps, indexed by [version is MPEG1][layer][bitrate index]
+MP3_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+# Hz, indexed by the version bits of the frame header
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# the format clips are normalized to when intermediate_format is "wav"
+CANONICAL_SAMPLE_RATE = 44100
+CANONICAL_CHANNELS = 1
+CANONICAL_CODEC = "pcm_s16le"
+
+
+class AudioInfo(NamedTuple):
+    duration: float
+    sample_rate: int
+    channels: int
+    codec: str
+
+
+class AudioProbeError(Exception):
+    def __init__(self, path: str, reason: str):
+        self.path = path
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"Couldn't read the audio file {self.path}: {self.reason}"
+
+
+class _Mp3Frame(NamedTuple):
+    length: int
+    samples: int
+    sample_rate: int
+    channels: int
+    mpeg1: bool
+
+
+def get_audio_info(path: str) -> AudioInfo:
+    """Reads the duration and format of an audio file from its headers.
+
+    MP3 and WAV files are parsed directly. Anything else is handed to a single ffprobe call.
+
+    Args:
+        path (str): The audio file
+
+    Raises:
+        AudioProbeError: If the file can't be read or has no audio
+
+    Returns:
+        AudioInfo: Duration in seconds, sample rate, channel count and codec name
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        raise AudioProbeError(path, str(e)) from e
+    if not data:
+        raise AudioProbeError(path, "the file is empty")
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return _wav_info(path, data)
+    start = _skip_id3(data)
+    if _mp3_frame(data, start) is not None or _find_mp3_sync(data, start) is not None:
+        return _mp3_info(path, data, start)
+    return _ffprobe_info(path)
+
+
+def get_duration(path: str) -> float:
+    """Returns the length of an audio file in seconds. See get_audio_info."""
+    return get_audio_info(path).duration
+
+
+def _wav_info(path: str, data: bytes) -> AudioInfo:
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack_from("<HHIIHH", data, body)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioProbeError(path, "the WAV data chunk comes before its fmt chunk")
+            format_tag, channels, sample_rate, byte_rate, _, bits = fmt
+            # streamed WAVs (e.g. from an ffmpeg pipe) don't know their data size up front
+            size = min(chunk_size, len(data) - body)
+            if not byte_rate:
+                raise AudioProbeError(path, "the WAV header has a byte rate of 0")
+            codec = {1: f"pcm_s{bits}le", 3: f"pcm_f{bits}le"}.get(format_tag, "wav")
+            if format_tag == 1 and bits == 8:
+                codec = "pcm_u8"
+            return AudioInfo(size / byte_rate, sample_rate, channels, codec)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise AudioProbeError(path, "no data chunk in the WAV file")
+
+
+def _skip_id3(data: bytes) -> int:
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = 0
+    for byte in data[6:10]:  # syncsafe integer
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _mp3_frame(data: bytes, offset: int) -> Optional[_Mp3Frame]:
+    if offset + 4 > len(data):
+        return None
+    header = struct.unpack_from(">I", data, offset)[0]
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 3
+    layer = 4 - ((header >> 17) & 3)
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header >> 9) & 1
+    channels = 1 if (header >> 6) & 3 == 3 else 2
+    if layer == 1:
+        return _Mp3Frame(
+            (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, channels, mpeg1
+        )
+    samples = 1152 if layer == 2 or mpeg1 else 576
+    length = samples // 8 * bitrate // sample_rate + padding
+    return _Mp3Frame(length, samples, sample_rate, channels, mpeg1)
+
+
+def _find_mp3_sync(data: bytes, offset: int) -> Optional[int]:
+    """Finds the next offset that starts two consecutive valid frames."""
+    while True:
+        offset = data.find(b"\xff", offset)
+        if offset == -1:
+            return None
+        frame = _mp3_frame(data, offset)
+        if frame is not None and (
+            offset + frame.length >= len(data) or _mp3_frame(data, offset + frame.length)
+        ):
+            return offset
+        offset += 1
+
+
+def _mp3_info(path: str, data: bytes, start: int) -> AudioInfo:
+    if _mp3_frame(data, start) is None:
+        start = _find_mp3_sync(data, start)
+    first = _mp3_frame(data, start)
+
+    frames = _vbr_frame_count(data, start, first)
+    if frames is not None:
+        return AudioInfo(
+            frames * first.samples / first.sample_rate, first.sample_rate, first.channels, "mp3"
+        )
+
+    # no usable Xing/VBRI header, so count the frames
+    samples = 0
+    offset = start
+    while offset is not None and offset < len(data):
+        frame = _mp3_frame(data, offset)
+        if frame is None:
+            offset = _find_mp3_sync(data, offset + 1)
+            continue
+        samples += frame.samples
+        offset += frame.length
+    if not samples:
+        raise AudioProbeError(path, "no MP3 frames found")
+    return AudioInfo(samples / first.sample_rate, first.sample_rate, first.channels, "mp3")
+
+
+def _vbr_frame_count(data: bytes, start: int, first: _Mp3Frame) -> Optional[int]:
+    """Reads the frame count from a Xing/Info or VBRI header in the first frame, if it has one.
+
+    The count is only trusted when the header's byte count matches the file, since naively
+    concatenated MP3s keep the header of their first part.
+    """
+    xing = _xing_offset(start, first)
+    audio_bytes = len(data) - start
+    if data[xing : xing + 4] in (b"Xing", b"Info") and xing + 16 <= len(data):
+        flags = struct.unpack_from(">I", data, xing + 4)[0]
+        if not flags & 1:
+            return None
+        frames = struct.unpack_from(">I", data, xing + 8)[0]
+        size = struct.unpack_from(">I", data, xing + 12)[0] if flags & 2 else None
+    elif data[start + 36 : start + 40] == b"VBRI" and start + 54 <= len(data):
+        size, frames = struct.unpack_from(">II", data, start + 46)
+    else:
+        return None
+    if size is None or abs(size - audio_bytes) > max(audio_bytes // 20, first.length * 2):
+        return None
+    return frames
+
+
+def _xing_offset(start: int, first: _Mp3Frame) -> int:
+    side_info = (
+        (32 if first.channels == 2 else 17) if first.mpeg1 else (17 if first.channels == 2 else 9)
+    )
+    return start + 4 + side_info
+
+
+def split_mp3(data: bytes, cut_times: List[float]) -> List[bytes]:
+    """Cuts MP3 data into len(cut_times) + 1 parts at the frame boundaries nearest to cut_times.
+
+    Frames are copied as they are, so nothing is re-encoded. A Xing/Info frame at the start is
+    dropped since its frame count would only describe the whole file.
+
+    Args:
+        data (bytes): The MP3 file
+        cut_times (List[float]): Ascending times in seconds to cut at
+
+    Raises:
+        ValueError: If the data has no MP3 frames
+
+    Returns:
+        List[bytes]: The parts, in order
+    """
+    start = _skip_id3(data)
+    if _mp3_frame(data, start) is None:
+        start = _find_mp3_sync(data, start)
+        if start is None:
+            raise ValueError("no MP3 frames found")
+    first = _mp3_frame(data, start)
+    xing = _xing_offset(start, first)
+    if data[xing : xing + 4] in (b"Xing", b"Info") or data[start + 36 : start + 40] == b"VBRI":
+        start += first.length
+
+    parts: List[bytes] = []
+    part_start = start
+    samples = 0
+    offset = end = start
+    cuts = iter(cut_times)
+    cut = next(cuts, None)
+    while offset is not None and offset < len(data):
+        frame = _mp3_frame(data, offset)
+        if frame is None:
+            offset = _find_mp3_sync(data, offset + 1)
+            continue
+        # a frame belongs to the part its midpoint falls in
+        while cut is not None and (samples + frame.samples / 2) / frame.sample_rate >= cut:
+            parts.append(data[part_start:offset])
+            part_start = offset
+            cut = next(cuts, None)
+        samples += frame.samples
+        offset += frame.length
+        end = offset
+    parts.append(data[part_start:end])
+    while cut is not None:  # cuts past the end of the audio
+        parts.append(b"")
+        cut = next(cuts, None)
+    return parts
+
+
+def concat_wav(paths: List[str], output: str, silence: float = 0.0) -> float:
+    """Joins PCM WAV files with the same format by appending their samples.
+
+    Nothing is decoded or re-encoded, so this costs about as much as copying the files.
+
+    Args:
+        paths (List[str]): The WAV files, in order
+        output (str): Where the joined file is written
+        silence (float): Seconds of silence appended after the last file
+
+    Raises:
+        ValueError: If the files don't share one sample rate, channel count and sample width
+
+    Returns:
+        float: Length of the output in seconds
+    """
+    partial = Path(f"{output}.partial")
+    with wave.open(str(partial), "wb") as out:
+        params = None
+        for path in paths:
+            with wave.open(path, "rb") as clip:
+                clip_params = (clip.getnchannels(), clip.getsampwidth(), clip.getframerate())
+                if params is None:
+                    params = clip_params
+                    out.setnchannels(params[0])
+                    out.setsampwidth(params[1])
+                    out.setframerate(params[2])
+                elif clip_params != params:
+                    raise ValueError(f"{path} has the format {clip_params}, expected {params}")
+                while True:
+                    frames = clip.readframes(1 << 16)
+                    if not frames:
+                        break
+                    out.writeframesraw(frames)
+        if params is None:
+            raise ValueError("no WAV files to join")
+        out.writeframes(b"\0" * int(silence * params[2]) * params[0] * params[1])
+        duration = out.getnframes() / params[2]
+    partial.replace(output)
+    return duration
+
+
+def _ffprobe_info(path: str) -> AudioInfo:
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "a:0",
+                "-show_entries",
+                "format=duration:stream=sample_rate,channels,codec_name",
+                "-of",
+                "json",
+                path,
+            ],
+            capture_output=True,
+            check=True,
+        )
+        probe = json.loads(result.stdout)
+        stream = probe["streams"][0]
+        return AudioInfo(
+            float(probe["format"]["duration"]),
+            int(stream["sample_rate"]),
+            int(stream["channels"]),
+            stream["codec_name"],
+        )
+    except subprocess.CalledProcessError as e:
+        raise AudioProbeError(path, e.stderr.decode("utf8", "replace").strip()) from e
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        raise AudioProbeError(path, f"ffprobe couldn't read it ({e!r})") from e
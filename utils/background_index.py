@@ -0,0 +1,228 @@
+import bisect
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from dataclasses import asdict, dataclass, field
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKGROUNDS_DIR = "assets/backgrounds"
+INDEX_PATH = "assets/backgrounds/index.json"
+
+
+@dataclass
+class MediaInfo:
+    """What the pipeline needs to know about a file in the background library."""
+
+    path: str
+    size: int
+    mtime: float
+    duration: float
+    codec: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    keyframes: List[float] = field(default_factory=list)  # seconds, videos only
+    sha256: Optional[str] = None  # filled in by get_file_hash
+
+    def keyframe_before(self, time: float) -> float:
+        """Returns the last keyframe at or before time, or 0 if none is known."""
+        i = bisect.bisect_right(self.keyframes, time)
+        return self.keyframes[i - 1] if i else 0.0
+
+
+class MediaProbeError(Exception):
+    def __init__(self, path: str, reason: str):
+        self.path = path
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"Couldn't probe the background {self.path}: {self.reason}"
+
+
+_lock = threading.Lock()
+
+
+def get_media_info(path: str) -> MediaInfo:
+    """Returns the indexed metadata of a background file, probing it if it's new or changed.
+
+    Entries are keyed by path and are only trusted while the file's size and mtime match.
+    """
+    with _lock:
+        index = _load_index()
+        info = _fresh_entry(index, path)
+        if info is None:
+            info = probe_media(path)
+            _save_index({path: asdict(info)})
+        return info
+
+
+def get_file_hash(path: str) -> str:
+    """Returns the sha256 of a background file's contents.
+
+    Hashing a whole video takes a while, so the hash is kept in the index with the rest of
+    the file's metadata and only computed again once the file changes.
+    """
+    info = get_media_info(path)
+    if info.sha256 is None:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as media:
+            for block in iter(lambda: media.read(1 << 20), b""):
+                sha256.update(block)
+        info.sha256 = sha256.hexdigest()
+        with _lock:
+            _save_index({path: asdict(info)})
+    return info.sha256
+
+
+def update_index(directory: str = BACKGROUNDS_DIR) -> Dict[str, MediaInfo]:
+    """Probes every new or changed file under directory and drops entries of deleted files.
+
+    Returns:
+        Dict[str, MediaInfo]: The whole index
+    """
+    with _lock:
+        index = _load_index()
+        changes: Dict[str, Optional[dict]] = {}
+        for path in list(index):
+            if not os.path.exists(path):
+                changes[path] = None
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = Path(root, name).as_posix()
+                if (
+                    path == INDEX_PATH
+                    or name.startswith(".")
+                    or name.endswith((".json", ".part", ".partial"))
+                ):
+                    continue
+                if _fresh_entry(index, path) is not None:
+                    continue
+                try:
+                    changes[path] = asdict(probe_media(path))
+                except MediaProbeError:
+                    continue  # not a media file
+        if changes:
+            index = _save_index(changes)
+        return {path: MediaInfo(**entry) for path, entry in index.items()}
+
+
+def probe_media(path: str) -> MediaInfo:
+    """Reads a file's streams and, for videos, its keyframe times with ffprobe.
+
+    Keyframes come from the packet flags, so nothing has to be decoded.
+    """
+    stat = os.stat(path)
+    probe = json.loads(
+        _ffprobe(
+            path,
+            "-show_entries",
+            "format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate,"
+            "sample_rate,channels",
+            "-of",
+            "json",
+        )
+    )
+    streams = probe.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), None)
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+    stream = video or audio
+    if stream is None or "duration" not in probe.get("format", {}):
+        raise MediaProbeError(path, "no audio or video stream")
+    info = MediaInfo(
+        path=path,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        duration=float(probe["format"]["duration"]),
+        codec=stream["codec_name"],
+    )
+    if video is not None:
+        info.width = int(video["width"])
+        info.height = int(video["height"])
+        if video.get("avg_frame_rate", "0/0") != "0/0":
+            info.fps = float(Fraction(video["avg_frame_rate"]))
+        packets = _ffprobe(
+            path,
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+        )
+        for line in packets.splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                info.keyframes.append(round(float(pts_time), 6))
+        info.keyframes.sort()
+    if audio is not None:
+        info.sample_rate = int(audio["sample_rate"])
+        info.channels = int(audio["channels"])
+    return info
+
+
+def _ffprobe(path: str, *args: str) -> str:
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", *args, path], capture_output=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise MediaProbeError(path, e.stderr.decode("utf8", "replace").strip()) from e
+    except OSError as e:
+        raise MediaProbeError(path, f"ffprobe couldn't be started ({e})") from e
+    return result.stdout.decode("utf8")
+
+
+def _fresh_entry(index: dict, path: str) -> Optional[MediaInfo]:
+    entry = index.get(path)
+    if entry is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+        return None
+    return MediaInfo(**entry)
+
+
+def _load_index() -> dict:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as raw_index:
+            return json.load(raw_index)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(changes: Dict[str, Optional[dict]]) -> dict:
+    """Applies changes to the index on disk and returns it. None removes an entry.
+
+    Other render processes may be saving the index as well, so it's read again right before
+    the write and the write goes through a temporary file of its own. The index is only a
+    cache, so errors are ignored and the entries are probed again next time.
+    """
+    index = _load_index()
+    for path, entry in changes.items():
+        if entry is None:
+            index.pop(path, None)
+        else:
+            index[path] = entry
+    partial = None
+    try:
+        Path(INDEX_PATH).parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=Path(INDEX_PATH).parent, suffix=".partial", delete=False
+        ) as raw_index:
+            partial = Path(raw_index.name)
+            json.dump(index, raw_index)
+        partial.replace(INDEX_PATH)
+    except OSError:
+        if partial is not None:
+            partial.unlink(missing_ok=True)
+    return index
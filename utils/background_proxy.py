@@ -0,0 +1,123 @@
+import json
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import ffmpeg
+import toml
+
+from utils.background_index import (
+    BACKGROUNDS_DIR,
+    get_file_hash,
+    get_media_info,
+    update_index,
+)
+from utils.console import print_step, print_substep
+
+PROXIES_DIR = f"{BACKGROUNDS_DIR}/proxies"
+# a keyframe every second, so stream-copy cuts start at most a second before the window
+PROXY_KEYFRAME_INTERVAL = 1
+
+
+def proxy_path(source: str, width: int, height: int) -> str:
+    """Where the proxy of source at width x height is cached.
+
+    The name contains the hash of the source, so a replaced source never matches an old proxy.
+    """
+    return f"{PROXIES_DIR}/{Path(source).stem}-{width}x{height}-{get_file_hash(source)[:12]}.mp4"
+
+
+def get_proxy(source: str, width: int, height: int) -> str:
+    """Returns the proxy of a background video at the output resolution, building it if needed.
+
+    A proxy is the source scaled and cropped to width x height and encoded with dense
+    keyframes. Cutting a job's background out of it is a stream copy that already has the
+    final size, so the render stage doesn't have to crop and re-encode it first.
+    """
+    path = proxy_path(source, width, height)
+    if Path(path).is_file():
+        return path
+    print_step(f"Building a {width}x{height} proxy of {source}. This is only done once. 😎")
+    # proxies of an older version of the source are useless now
+    for stale in Path(PROXIES_DIR).glob(f"{Path(source).stem}-{width}x{height}-*.mp4"):
+        stale.unlink()
+    Path(PROXIES_DIR).mkdir(parents=True, exist_ok=True)
+    fps = get_media_info(source).fps or 30
+    partial = f"{path}.partial"
+    try:
+        (
+            ffmpeg.input(source)
+            .filter("scale", width, height, force_original_aspect_ratio="increase")
+            .filter("crop", width, height)
+            .filter("setsar", 1)
+            .output(
+                partial,
+                f="mp4",
+                an=None,
+                **{
+                    "c:v": "libx264",
+                    "crf": 18,
+                    "preset": "medium",
+                    "pix_fmt": "yuv420p",
+                    "g": round(fps * PROXY_KEYFRAME_INTERVAL),
+                    "keyint_min": round(fps * PROXY_KEYFRAME_INTERVAL),
+                    "sc_threshold": 0,
+                    "movflags": "+faststart",
+                },
+            )
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        Path(partial).unlink(missing_ok=True)
+        print(e.stderr.decode("utf8"))
+        raise
+    Path(partial).replace(path)
+    print_substep("Background proxy built successfully! 🎉", style="bold green")
+    return path
+
+
+def build_proxies(resolutions: Iterable[Tuple[int, int]]) -> List[str]:
+    """Builds the missing proxies of every downloaded video in utils/background_videos.json.
+
+    Returns:
+        List[str]: The paths of all proxies
+    """
+    with open("./utils/background_videos.json") as json_file:
+        background_videos = json.load(json_file)
+    del background_videos["__comment"]
+    proxies = []
+    for _, filename, _, _ in background_videos.values():
+        source = f"{BACKGROUNDS_DIR}/video/{filename}"
+        if not Path(source).is_file():
+            print_substep(f"Skipping {filename}, it wasn't downloaded yet.")
+            continue
+        for width, height in resolutions:
+            proxies.append(get_proxy(source, width, height))
+    return proxies
+
+
+def _parse_resolution(resolution: str) -> Tuple[int, int]:
+    width, _, height = resolution.partition("x")
+    return int(width), int(height)
+
+
+def main(args: Optional[List[str]] = None):
+    """python -m utils.background_proxy [WIDTHxHEIGHT ...]
+
+    Without arguments, the resolution from config.toml is used.
+    """
+    args = sys.argv[1:] if args is None else args
+    if args:
+        resolutions = [_parse_resolution(resolution) for resolution in args]
+    else:
+        config = toml.load("config.toml")
+        resolutions = [
+            (int(config["settings"]["resolution_w"]), int(config["settings"]["resolution_h"]))
+        ]
+    update_index()
+    build_proxies(resolutions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+from typing import List, NamedTuple
+
+FONTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "fonts"))
+
+# the look of the old drawtext captions: Roboto Black, white with a black border, centered
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+ScaledBorderAndShadow: yes
+WrapStyle: 0
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Caption,Roboto Black,48,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,5,0,0,0,1
+Style: Credit,Roboto Black,5,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,0,0,3,0,0,0,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+class Caption(NamedTuple):
+    start: float
+    end: float
+    text: str
+    style: str = "Caption"
+
+
+def write_ass(path: str, captions: List[Caption], width: int, height: int):
+    """Writes captions as an ASS subtitle file for the ass filter.
+
+    All captions are rendered by one filter, so the filter graph doesn't grow with the text.
+    Sizes are in pixels of a width x height video. The fonts are in FONTS_DIR, pass it to the
+    filter as fontsdir.
+    """
+    lines = [ASS_HEADER.format(width=width, height=height)]
+    for caption in sorted(captions, key=lambda caption: caption.start):
+        lines.append(
+            f"Dialogue: 0,{_timestamp(caption.start)},{_timestamp(caption.end)},{caption.style},"
+            f",0,0,0,,{_escape(caption.text)}\n"
+        )
+    with open(path, "w", encoding="utf-8") as ass:
+        ass.writelines(lines)
+
+
+def _timestamp(seconds: float) -> str:
+    centiseconds = round(seconds * 100)
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    return f"{hours}:{minutes:02d}:{centiseconds / 100:05.2f}"
+
+
+def _escape(text: str) -> str:
+    # a zero width space keeps a literal backslash from starting an override like \N
+    text = text.replace("\\", "\\\u200b").replace("{", "\\{").replace("}", "\\}")
+    return " ".join(text.split())
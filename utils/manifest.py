@@ -0,0 +1,118 @@
+import json
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+
+@dataclass
+class ClipInfo:
+    """One audio clip saved by TTSEngine."""
+
+    path: str
+    duration: float
+    sample_rate: int
+    channels: int
+    codec: str
+    text: str
+    voice: Optional[str] = None
+
+
+@dataclass
+class BackgroundInfo:
+    """The background footage of the job.
+
+    path, width and height describe the file the final render uses. source, start and end
+    describe where in the background library it was taken from. Cuts begin on a keyframe, so
+    the footage the video should show starts offset seconds into the file.
+    """
+
+    path: str
+    width: int
+    height: int
+    duration: float
+    fps: Optional[float] = None
+    source: Optional[str] = None
+    start: Optional[float] = None
+    end: Optional[float] = None
+    offset: float = 0.0
+
+
+@dataclass
+class BackgroundAudioInfo:
+    """The part of the background library's audio the job plays under the narration."""
+
+    path: str
+    start: float
+    duration: float
+
+
+@dataclass
+class JobManifest:
+    """Everything the render stage needs to know about a job without probing its files.
+
+    Written to assets/temp/{reddit_id}/manifest.json by the TTS and background stages.
+    """
+
+    clips: Dict[str, ClipInfo] = field(default_factory=dict)
+    background: Optional[BackgroundInfo] = None
+    background_audio: Optional[BackgroundAudioInfo] = None
+
+    def clip(self, name: str) -> ClipInfo:
+        try:
+            return self.clips[name]
+        except KeyError:
+            raise KeyError(f"The clip {name} wasn't recorded in the job manifest") from None
+
+
+_lock = threading.Lock()
+
+
+def manifest_path(reddit_id: str) -> Path:
+    return Path(f"assets/temp/{reddit_id}/manifest.json")
+
+
+def load_manifest(reddit_id: str) -> JobManifest:
+    """Reads the manifest of a job. Returns an empty manifest if none was written yet."""
+    path = manifest_path(reddit_id)
+    if not path.exists():
+        return JobManifest()
+    with open(path, "r", encoding="utf-8") as raw_manifest:
+        data = json.load(raw_manifest)
+    return JobManifest(
+        clips={name: ClipInfo(**clip) for name, clip in data.get("clips", {}).items()},
+        background=BackgroundInfo(**data["background"]) if data.get("background") else None,
+        background_audio=(
+            BackgroundAudioInfo(**data["background_audio"]) if data.get("background_audio") else None
+        ),
+    )
+
+
+def save_manifest(
+    reddit_id: str,
+    clips: Optional[Dict[str, ClipInfo]] = None,
+    background: Optional[BackgroundInfo] = None,
+    background_audio: Optional[BackgroundAudioInfo] = None,
+) -> JobManifest:
+    """Merges clips, background and/or background audio into the manifest of a job.
+
+    Stages may run at the same time, so each one only replaces the parts it owns.
+
+    Returns:
+        JobManifest: The updated manifest
+    """
+    with _lock:
+        manifest = load_manifest(reddit_id)
+        if clips is not None:
+            manifest.clips.update(clips)
+        if background is not None:
+            manifest.background = background
+        if background_audio is not None:
+            manifest.background_audio = background_audio
+        path = manifest_path(reddit_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".json.partial")
+        with open(partial, "w", encoding="utf-8") as raw_manifest:
+            json.dump(asdict(manifest), raw_manifest, ensure_ascii=False, indent=4)
+        partial.replace(path)
+    return manifest
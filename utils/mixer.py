@@ -0,0 +1,266 @@
+import os
+import subprocess
+import wave
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from utils.audio import CANONICAL_CHANNELS, CANONICAL_SAMPLE_RATE, get_audio_info
+
+# longer mixes are assembled in a memory-mapped scratch file instead of RAM
+MEMMAP_SECONDS = 600
+# resolution of the ducking envelope, and how long it takes to fade in and out
+DUCKING_BLOCK_SECONDS = 0.01
+DUCKING_FADE_SECONDS = 0.2
+CHUNK_SECONDS = 10
+
+
+class MixResult(NamedTuple):
+    offsets: List[float]  # start of every clip in seconds
+    duration: float
+
+
+def decode(
+    path: str,
+    start: float = 0.0,
+    duration: Optional[float] = None,
+    sample_rate: int = CANONICAL_SAMPLE_RATE,
+    channels: int = CANONICAL_CHANNELS,
+) -> np.ndarray:
+    """Decodes (a part of) an audio file into float32 samples of shape (frames, channels).
+
+    16 bit WAVs in the right format are read directly, everything else is decoded by ffmpeg.
+    """
+    info = get_audio_info(path)
+    if (
+        info.codec == "pcm_s16le"
+        and info.sample_rate == sample_rate
+        and info.channels == channels
+        and not start
+        and duration is None
+    ):
+        with wave.open(path, "rb") as clip:
+            frames = clip.readframes(clip.getnframes())
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+        return samples.reshape(-1, channels)
+    result = subprocess.run(
+        _decoder_args(path, start, duration, sample_rate, channels), capture_output=True
+    )
+    if result.returncode:
+        raise RuntimeError(
+            f"ffmpeg couldn't decode {path}: {result.stderr.decode('utf8', 'replace').strip()}"
+        )
+    return np.frombuffer(result.stdout, dtype="<f4").reshape(-1, channels)
+
+
+def assemble(
+    clip_paths: List[str],
+    narration_output: str,
+    gap: float = 0.0,
+    background: Optional[str] = None,
+    background_start: float = 0.0,
+    background_volume: float = 0.0,
+    ducking: float = 1.0,
+    mixed_output: Optional[str] = None,
+    scratch_dir: Optional[str] = None,
+) -> MixResult:
+    """Joins clips with `gap` seconds of silence between them and mixes in background audio.
+
+    The narration is written to narration_output. If a background is given, it is started at
+    background_start, scaled by background_volume, lowered further to `ducking` times that
+    while someone speaks, and the mix is written to mixed_output. Both outputs are 16 bit WAVs
+    in the canonical format, so the final mux is the only encode.
+
+    Args:
+        clip_paths (List[str]): The clips, in order
+        narration_output (str): Where the narration alone is written
+        gap (float): Seconds of silence between clips
+        background (str, optional): Background audio file
+        background_start (float): Where in the background file to start, in seconds
+        background_volume (float): Gain of the background audio
+        ducking (float): Extra gain of the background under speech. 1 turns ducking off
+        mixed_output (str, optional): Where narration and background are written together
+        scratch_dir (str, optional): Directory for the memory-mapped buffer of long mixes
+
+    Returns:
+        MixResult: Sample accurate clip start times and the total length in seconds
+    """
+    sample_rate, channels = CANONICAL_SAMPLE_RATE, CANONICAL_CHANNELS
+    gap_frames = int(round(gap * sample_rate))
+    estimate = sum(int(get_audio_info(path).duration * sample_rate) for path in clip_paths)
+    estimate += gap_frames * len(clip_paths) + sample_rate  # decoders may add a few frames
+    buffer = _Buffer(estimate, channels, scratch_dir, memmap=estimate > MEMMAP_SECONDS * sample_rate)
+
+    offsets: List[int] = []
+    speech: List[tuple] = []
+    position = 0
+    for i, path in enumerate(clip_paths):
+        if i:
+            position += gap_frames
+        clip = decode(path, sample_rate=sample_rate, channels=channels)
+        buffer.write(position, clip)
+        offsets.append(position)
+        speech.append((position, position + len(clip)))
+        position += len(clip)
+    narration = buffer.view(position)
+
+    _write_wav(narration_output, narration, sample_rate)
+    if background is not None and mixed_output is not None:
+        gain = _ducking_envelope(speech, position, sample_rate, ducking) * background_volume
+        _mix_background(
+            narration, background, background_start, gain, mixed_output, sample_rate, channels
+        )
+    del narration
+    buffer.close()
+    return MixResult([offset / sample_rate for offset in offsets], position / sample_rate)
+
+
+def _ducking_envelope(
+    speech: List[tuple], frames: int, sample_rate: int, ducking: float
+) -> np.ndarray:
+    """Returns the background gain per DUCKING_BLOCK_SECONDS block, faded around speech."""
+    block = int(sample_rate * DUCKING_BLOCK_SECONDS)
+    blocks = frames // block + 1
+    gain = np.ones(blocks, dtype=np.float32)
+    if ducking >= 1:
+        return gain
+    for start, end in speech:
+        gain[start // block : end // block + 1] = ducking
+    fade = max(1, int(DUCKING_FADE_SECONDS / DUCKING_BLOCK_SECONDS))
+    padded = np.pad(gain, fade, mode="edge")
+    return np.convolve(padded, np.ones(fade) / fade, mode="same")[fade:-fade].astype(np.float32)
+
+
+def _mix_background(
+    narration: np.ndarray,
+    background: str,
+    start: float,
+    gain: np.ndarray,
+    output: str,
+    sample_rate: int,
+    channels: int,
+):
+    """Streams the background through ffmpeg and mixes it in CHUNK_SECONDS at a time."""
+    block = int(sample_rate * DUCKING_BLOCK_SECONDS)
+    chunk = CHUNK_SECONDS * sample_rate
+    frame_bytes = 4 * channels
+    frames = len(narration)
+    process = subprocess.Popen(
+        _decoder_args(background, start, frames / sample_rate, sample_rate, channels),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    with _WavWriter(output, sample_rate, channels) as out:
+        position = 0
+        while position < frames:
+            end = min(frames, position + chunk)
+            data = process.stdout.read((end - position) * frame_bytes)
+            bg = np.zeros((end - position, channels), dtype=np.float32)
+            if data:
+                decoded = np.frombuffer(data[: len(data) // frame_bytes * frame_bytes], "<f4")
+                decoded = decoded.reshape(-1, channels)
+                bg[: len(decoded)] = decoded
+            envelope = gain[np.arange(position, end) // block][:, None]
+            out.write(narration[position:end] + bg * envelope)
+            position = end
+        process.stdout.read()  # ffmpeg may round up the last few frames
+        error = process.stderr.read()
+        if process.wait():
+            raise RuntimeError(
+                f"ffmpeg couldn't decode {background}: {error.decode('utf8', 'replace').strip()}"
+            )
+
+
+class _Buffer:
+    """A float32 sample buffer in RAM, or in a memory-mapped scratch file for long audio."""
+
+    def __init__(self, frames: int, channels: int, scratch_dir: Optional[str], memmap: bool):
+        self.channels = channels
+        self.path = None
+        if memmap:
+            Path(scratch_dir or ".").mkdir(parents=True, exist_ok=True)
+            self.path = os.path.join(scratch_dir or ".", f"mix-{os.getpid()}.f32")
+            self.data = np.memmap(self.path, np.float32, "w+", shape=(frames, channels))
+        else:
+            self.data = np.zeros((frames, channels), dtype=np.float32)
+
+    def write(self, position: int, samples: np.ndarray):
+        end = position + len(samples)
+        if end > len(self.data):
+            self._grow(end + len(self.data) // 10)
+        self.data[position:end] = samples
+
+    def view(self, frames: int) -> np.ndarray:
+        return self.data[:frames]
+
+    def _grow(self, frames: int):
+        if self.path is None:
+            grown = np.zeros((frames, self.channels), dtype=np.float32)
+            grown[: len(self.data)] = self.data
+            self.data = grown
+        else:
+            self.data.flush()
+            del self.data
+            with open(self.path, "r+b") as f:
+                f.truncate(frames * self.channels * 4)
+            self.data = np.memmap(self.path, np.float32, "r+", shape=(frames, self.channels))
+
+    def close(self):
+        if self.path is not None:
+            del self.data
+            os.unlink(self.path)
+
+
+class _WavWriter:
+    """Writes float32 chunks to a 16 bit WAV file."""
+
+    def __init__(self, path: str, sample_rate: int, channels: int):
+        self.path = path
+        self.partial = Path(f"{path}.partial")
+        self.file = wave.open(str(self.partial), "wb")
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(sample_rate)
+
+    def write(self, samples: np.ndarray):
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+        self.file.writeframesraw(pcm.tobytes())
+
+    def __enter__(self) -> "_WavWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.file.close()
+        if exc_type is None:
+            self.partial.replace(self.path)
+        else:
+            self.partial.unlink(missing_ok=True)
+
+
+def _write_wav(path: str, samples: np.ndarray, sample_rate: int):
+    chunk = CHUNK_SECONDS * sample_rate
+    with _WavWriter(path, sample_rate, samples.shape[1]) as out:
+        for start in range(0, len(samples), chunk):
+            out.write(samples[start : start + chunk])
+
+
+def _decoder_args(
+    path: str, start: float, duration: Optional[float], sample_rate: int, channels: int
+) -> List[str]:
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if start:
+        args += ["-ss", str(start)]
+    if duration is not None:
+        args += ["-t", str(duration)]
+    return args + [
+        "-i",
+        path,
+        "-f",
+        "f32le",
+        "-ac",
+        str(channels),
+        "-ar",
+        str(sample_rate),
+        "pipe:1",
+    ]
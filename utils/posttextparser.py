@@ -1,16 +1,72 @@
 import os
 import re
 import time
-from typing import List
-
-import spacy
+from typing import Final, List
 
+from utils import settings
 from utils.console import print_step
 from utils.voice import sanitize_text
 
+# lowercase, without the trailing period. These never end a sentence
+ABBREVIATIONS: Final[frozenset] = frozenset(
+    {
+        "mr",
+        "mrs",
+        "ms",
+        "prof",
+        "sr",
+        "jr",
+        "vs",
+        "approx",
+        "apt",
+        "dept",
+        "e.g",
+        "i.e",
+        "u.s",
+        "u.k",
+        "tl;dr",
+    }
+)
+# only abbreviations when capitalized, as in "Dr. Smith" or "St. Louis"
+TITLE_ABBREVIATIONS: Final[frozenset] = frozenset({"dr", "st", "mt"})
+# only abbreviations before a number, as in "No. 5" or "Mar. 3". "She said no. Then" ends
+NUMBER_ABBREVIATIONS: Final[frozenset] = frozenset(
+    {
+        "no",
+        "vol",
+        "fig",
+        "est",
+        "jan",
+        "feb",
+        "mar",
+        "apr",
+        "jun",
+        "jul",
+        "aug",
+        "sep",
+        "sept",
+        "oct",
+        "nov",
+        "dec",
+    }
+)
+
+TERMINATORS: Final[str] = ".!?…"
+CLOSERS: Final[str] = "\"'”’)]*_"
+
+_markdown_heading = re.compile(r"^\s*#{1,6}\s+")
+_markdown_link = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_markdown_line_prefix = re.compile(r"^\s*(?:#{1,6}\s+|>+\s*|[*+-]\s+|\d+[.)]\s+)")
+_markdown_inline = re.compile(r"\*\*|__|~~|`|\^")
+
 
 # working good
 def posttextparser(obj, *, tried: bool = False) -> List[str]:
+    if settings.config["settings"]["storymode_segmenter"] == "rules":
+        return [line for line in rule_based_sentences(obj) if sanitize_text(line)]
+
+    import spacy
+
     text: str = re.sub("\n", " ", obj)
     try:
         nlp = spacy.load("en_core_web_sm")
@@ -33,3 +89,102 @@ def posttextparser(obj, *, tried: bool = False) -> List[str]:
             newtext.append(line.text)
 
     return newtext
+
+
+def strip_markdown(text: str) -> List[str]:
+    """Removes reddit markdown and splits the text into blocks that can never share a sentence.
+
+    Blank lines, list items, headings and quotes each start a new block, and headings are
+    blocks of their own.
+
+    Args:
+        text (str): Raw selftext of the post
+
+    Returns:
+        List[str]: The blocks, with markdown syntax removed
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in text.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append(" ".join(current))
+                current = []
+            continue
+        stripped = _markdown_line_prefix.sub("", line)
+        if stripped != line and current:  # headings and list items start a new block
+            blocks.append(" ".join(current))
+            current = []
+        stripped = _markdown_inline.sub("", _markdown_link.sub(r"\1", stripped)).strip()
+        if stripped:
+            current.append(stripped)
+        if _markdown_heading.match(line) and current:  # a heading never runs into the body
+            blocks.append(" ".join(current))
+            current = []
+    if current:
+        blocks.append(" ".join(current))
+    return blocks
+
+
+def rule_based_sentences(text: str) -> List[str]:
+    """Splits text into sentences without loading a language model.
+
+    Runs in a single pass over the text. Handles common abbreviations, initials, decimals,
+    ellipses, closing quotes and reddit markdown.
+
+    Args:
+        text (str): Raw selftext of the post
+
+    Returns:
+        List[str]: The sentences, in order
+    """
+    sentences: List[str] = []
+    for block in strip_markdown(text):
+        block = " ".join(block.split())
+        length = len(block)
+        start = 0
+        i = 0
+        while i < length:
+            if block[i] not in TERMINATORS:
+                i += 1
+                continue
+            end = i
+            while end < length and block[end] in TERMINATORS:
+                end += 1
+            terminators = block[i:end]
+            while end < length and block[end] in CLOSERS:
+                end += 1
+            if end < length and block[end] != " ":  # decimals, urls, "e.g.", "U.S.A."
+                i = end
+                continue
+            next_char = block[end + 1] if end + 1 < length else ""
+            if _is_boundary(block, start, i, terminators, next_char):
+                sentence = block[start:end].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = end + 1
+            i = end
+        if block[start:].strip():
+            sentences.append(block[start:].strip())
+    return sentences
+
+
+def _is_boundary(block: str, start: int, index: int, terminators: str, next_char: str) -> bool:
+    if not next_char:
+        return True
+    if "?" in terminators or "!" in terminators:
+        return True
+    if len(terminators) > 1 or terminators == "…":  # ellipsis only ends a sentence before a capital
+        return next_char.isupper() or next_char.isdigit()
+    word_start = block.rfind(" ", start, index) + 1
+    written = block[word_start:index].lstrip("\"'“‘([")
+    word = written.lower()
+    if word in ABBREVIATIONS:
+        return False
+    if word in TITLE_ABBREVIATIONS and written[:1].isupper():
+        return False
+    if word in NUMBER_ABBREVIATIONS and next_char.isdigit():
+        return False
+    if len(word) == 1 and word.isalpha() and word != "i":  # initials like "J. R. R. Tolkien"
+        return False
+    return not next_char.islower()
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+RATELIMIT_DIR = "assets/ratelimit"
+
+
+class RateLimiter:
+    """Spaces out calls so no more than `rate` of them start per second.
+
+    Args:
+        rate (float): Maximum calls per second. 0 disables the limit.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0.0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "waits": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+    def acquire(self) -> float:
+        """Blocks until the next call may start.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next_call - now)
+            self._next_call = max(now, self._next_call) + self.interval
+        return self._wait(wait)
+
+    def pause(self, seconds: float):
+        """Holds back every caller for the next `seconds`, e.g. after the server sent a 429.
+
+        Several workers hitting the limit at once only extend the pause, they don't stack it.
+        """
+        with self._lock:
+            self._next_call = max(self._next_call, time.monotonic() + seconds)
+
+    def metrics(self) -> Dict[str, float]:
+        """Returns how often and how long callers of this process had to wait."""
+        with self._lock:
+            return dict(self._metrics)
+
+    def _wait(self, wait: float) -> float:
+        with self._lock:
+            self._metrics["calls"] += 1
+            if wait:
+                self._metrics["waits"] += 1
+                self._metrics["wait_total"] += wait
+                self._metrics["wait_max"] = max(self._metrics["wait_max"], wait)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter(RateLimiter):
+    """A token bucket shared by every process on this machine that uses the same key.
+
+    The bucket lives in a small file under assets/ratelimit and is updated under an exclusive
+    file lock, so parallel render processes calling the same provider share one quota. A call
+    takes its token right away and then sleeps until the token would have been refilled, so
+    the lock is only held for a read and a write.
+
+    Args:
+        key (str): Name of the bucket, e.g. the provider and a hash of its credential
+        rate (float): Tokens refilled per second. 0 disables the limit.
+        burst (float): Size of the bucket, i.e. calls allowed back to back after an idle period
+    """
+
+    _STATE = struct.Struct("<ddd")  # tokens, last update, paused until
+
+    def __init__(self, key: str, rate: float, burst: float = 1, directory: str = RATELIMIT_DIR):
+        super().__init__(rate)
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.path = Path(directory) / f"{key}.bucket"
+        self._file = None
+
+    def acquire(self) -> float:
+        with self._locked() as state:
+            now = time.time()
+            tokens, updated, paused_until = state
+            if self.rate:
+                tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+                wait = max(-tokens / self.rate if tokens < 0 else 0.0, paused_until - now)
+            else:
+                # without a limit there are no tokens to take, but a pause still holds callers
+                wait = max(0.0, paused_until - now)
+            state[:] = [tokens, now, paused_until]
+        return self._wait(wait)
+
+    def pause(self, seconds: float):
+        with self._locked() as state:
+            state[2] = max(state[2], time.time() + seconds)
+
+    def _locked(self) -> "_BucketLock":
+        return _BucketLock(self)
+
+    def _open(self):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._file = os.fdopen(fd, "r+b", buffering=0)
+        return self._file
+
+
+class _BucketLock:
+    """Holds the thread and file locks of a SharedRateLimiter and reads/writes its state."""
+
+    def __init__(self, limiter: SharedRateLimiter):
+        self.limiter = limiter
+
+    def __enter__(self) -> list:
+        limiter = self.limiter
+        limiter._lock.acquire()
+        try:
+            self.file = limiter._open()
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+            else:
+                self.file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:  # LK_LOCK gives up after 10 seconds
+                        pass
+            self.file.seek(0)
+            data = self.file.read(SharedRateLimiter._STATE.size)
+        except BaseException:
+            limiter._lock.release()
+            raise
+        if len(data) == SharedRateLimiter._STATE.size:
+            self.state = list(SharedRateLimiter._STATE.unpack(data))
+        else:  # a new bucket starts full
+            self.state = [limiter.burst, time.time(), 0.0]
+        return self.state
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self.file.seek(0)
+                self.file.write(SharedRateLimiter._STATE.pack(*self.state))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.limiter._lock.release()
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_key(name: str, credential: Optional[str] = None) -> str:
+    """Bucket name of a provider. Credentials are hashed so they never end up in a file name."""
+    if not credential:
+        return name
+    return f"{name}-{hashlib.sha256(str(credential).encode()).hexdigest()[:12]}"
+
+
+def get_limiter(name: str, rate: float, credential: Optional[str] = None) -> RateLimiter:
+    """Returns the limiter shared by everything on this machine that uses `name` and `credential`.
+
+    Within a process the same object is returned every time, and across processes the limiters
+    share a bucket file.
+    """
+    key = limiter_key(name, credential)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = SharedRateLimiter(key, rate)
+        return _limiters[key]
+
+
+def limiter_metrics() -> Dict[str, Dict[str, float]]:
+    """Wait-time metrics of every limiter this process has used, by bucket name."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {key: limiter.metrics() for key, limiter in limiters.items()}
@@ -1,8 +1,10 @@
+import random
 import re
 import sys
 import time as pytime
 from datetime import datetime
 from time import sleep
+from typing import Optional
 
 from cleantext import clean
 from requests import Response
@@ -30,6 +32,29 @@ def check_ratelimit(response: Response) -> bool:
     return True
 
 
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Exponential back-off with full jitter.
+    Returns a random delay between 0 and base * 2**attempt seconds, capped at cap.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry_after(response: Response) -> Optional[float]:
+    """
+    Reads how long a ratelimited response asks us to wait, in seconds.
+    Returns None if the response doesn't say.
+    """
+    try:
+        if "Retry-After" in response.headers:
+            return max(0.0, float(response.headers["Retry-After"]))
+        if "X-RateLimit-Reset" in response.headers:
+            return max(0.0, int(response.headers["X-RateLimit-Reset"]) - pytime.time())
+    except ValueError:  # e.g. an HTTP date instead of seconds
+        pass
+    return None
+
+
 def sleep_until(time) -> None:
     """
     Pause your program until a specific end time.
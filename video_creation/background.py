@@ -5,12 +5,20 @@ from pathlib import Path
 from random import randrange
 from typing import Any, Dict, Tuple
 
+import ffmpeg
 import yt_dlp
-from moviepy.editor import AudioFileClip, VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
+from moviepy.editor import AudioFileClip
 
 from utils import settings
+from utils.background_index import MediaInfo, get_media_info
+from utils.background_proxy import get_proxy
 from utils.console import print_step, print_substep
+from utils.manifest import (
+    BackgroundAudioInfo,
+    BackgroundInfo,
+    load_manifest,
+    save_manifest,
+)
 
 
 def load_background_options():
@@ -93,6 +101,8 @@ def download_background_video(background_config: Tuple[str, str, str, Any]):
 
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         ydl.download(uri)
+    # probe it once now, so the keyframes are indexed before the first video is made
+    get_media_info(f"assets/backgrounds/video/{filename}")
     print_substep("Background video downloaded successfully! 🎉", style="bold green")
 
 
@@ -120,6 +130,49 @@ def download_background_audio(background_config: Tuple[str, str, str]):
     print_substep("Background audio downloaded successfully! 🎉", style="bold green")
 
 
+def cut_video(info: MediaInfo, start: float, length: float, output: str) -> Tuple[float, float]:
+    """Cuts the window of length seconds at start out of a video, without re-encoding it.
+
+    The cut begins on the last keyframe before start, so the video stream can be copied
+    as is, and runs until the end of the window. The render stage skips the returned
+    offset to start exactly at start. If the keyframes aren't indexed, ffmpeg still snaps
+    the copy to a keyframe, but the offset isn't known and is returned as 0.
+
+    Args:
+        info (MediaInfo): The indexed source video
+        start (float): Where the window should start, in seconds
+        length (float): Length of the window in seconds
+        output (str): Where the cut is written
+
+    Returns:
+        Tuple[float, float]: Where the cut starts in the source, and where the window starts
+        in the cut
+    """
+    offset = 0.0
+    if info.keyframes:
+        keyframe = info.keyframe_before(start)
+        start, offset = keyframe, round(start - keyframe, 6)
+    try:
+        (
+            ffmpeg.input(info.path, ss=start, t=offset + length)
+            .output(output, an=None, c="copy", avoid_negative_ts="make_zero")
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        # some containers can't be cut without re-encoding, fall back to an exact cut
+        print_substep(f"Couldn't copy the background ({e.stderr.decode('utf8').strip()}).")
+        print_substep("Re-encoding the background clip instead...")
+        (
+            ffmpeg.input(info.path, ss=start + offset, t=length)
+            .output(output, an=None, **{"c:v": "h264", "b:v": "20M"})
+            .overwrite_output()
+            .run(quiet=True)
+        )
+        return start + offset, 0.0
+    return start, offset
+
+
 def chop_background(background_config: Dict[str, Tuple], video_length: int, reddit_object: dict):
     """Generates the background audio and footage to be used in the video and writes it to assets/temp/background.mp3 and assets/temp/background.mp4
 
@@ -128,41 +181,128 @@ def chop_background(background_config: Dict[str, Tuple], video_length: int, redd
         video_length (int): Length of the clip where the background footage is to be taken out of
     """
     id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
+    # may run before the TTS stage has created the job's directory
+    Path(f"assets/temp/{id}").mkdir(parents=True, exist_ok=True)
 
     if settings.config["settings"]["background"][f"background_audio_volume"] == 0:
         print_step("Volume was set to 0. Skipping background audio creation . . .")
     else:
         print_step("Finding a spot in the backgrounds audio to chop...✂️")
         audio_choice = f"{background_config['audio'][2]}-{background_config['audio'][1]}"
-        background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
+        audio_path = f"assets/backgrounds/audio/{audio_choice}"
         start_time_audio, end_time_audio = get_start_and_end_times(
-            video_length, background_audio.duration
+            video_length, get_media_info(audio_path).duration
         )
-        background_audio = background_audio.subclip(start_time_audio, end_time_audio)
-        background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
+        if settings.config["settings"]["audio_engine"] == "numpy":
+            # the audio mixer reads the cut straight from the library, nothing is re-encoded
+            save_manifest(
+                id,
+                background_audio=BackgroundAudioInfo(
+                    path=audio_path,
+                    start=start_time_audio,
+                    duration=end_time_audio - start_time_audio,
+                ),
+            )
+        else:
+            background_audio = AudioFileClip(audio_path).subclip(start_time_audio, end_time_audio)
+            background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
 
     print_step("Finding a spot in the backgrounds video to chop...✂️")
     video_choice = background_config['video'][1]
-    background_video = VideoFileClip(f"assets/backgrounds/video/{video_choice}")
-    start_time_video, end_time_video = get_start_and_end_times(
-        video_length, background_video.duration
-    )
-    # Extract video subclip
-    try:
-        ffmpeg_extract_subclip(
-            f"assets/backgrounds/video/{video_choice}",
-            start_time_video,
-            end_time_video,
-            targetname=f"assets/temp/{id}/background.mp4",
+    source = f"assets/backgrounds/video/{video_choice}"
+    if settings.config["settings"]["background"]["background_proxies"]:
+        # cut from a copy that is already cropped and scaled to the video's resolution
+        source = get_proxy(
+            source,
+            int(settings.config["settings"]["resolution_w"]),
+            int(settings.config["settings"]["resolution_h"]),
         )
-    except (OSError, IOError):  # ffmpeg issue see #348
-        print_substep("FFMPEG issue. Trying again...")
-        with VideoFileClip(f"assets/backgrounds/video/{video_choice}") as video:
-            new = video.subclip(start_time_video, end_time_video)
-            new.write_videofile(f"assets/temp/{id}/background.mp4")
+    # read from the background index instead of opening the whole video with moviepy
+    video_info = get_media_info(source)
+    start_time_video, _ = get_start_and_end_times(video_length, video_info.duration)
+    if settings.config["settings"]["render_mode"] == "single":
+        # the final render seeks into the source itself, so there is nothing to cut
+        save_manifest(
+            id,
+            background=BackgroundInfo(
+                path=source,
+                width=video_info.width,
+                height=video_info.height,
+                duration=video_info.duration,
+                fps=video_info.fps,
+                source=source,
+                start=start_time_video,
+                end=start_time_video + video_length,
+                offset=start_time_video,
+            ),
+        )
+        print_substep("Background video picked successfully!", style="bold green")
+        return background_config["video"][2]
+    # the window starts on a keyframe, so the cut is a stream copy without decoding anything
+    start_time_video, offset = cut_video(
+        video_info, start_time_video, video_length, f"assets/temp/{id}/background.mp4"
+    )
+    save_manifest(
+        id,
+        background=BackgroundInfo(
+            path=f"assets/temp/{id}/background.mp4",
+            width=video_info.width,
+            height=video_info.height,
+            duration=offset + video_length,
+            fps=video_info.fps,
+            source=source,
+            start=start_time_video,
+            end=start_time_video + offset + video_length,
+            offset=offset,
+        ),
+    )
     print_substep("Background video chopped successfully!", style="bold green")
     return background_config["video"][2]
 
 
+def fit_background(
+    background_config: Dict[str, Tuple],
+    estimated_length: float,
+    video_length: int,
+    reddit_object: dict,
+):
+    """Trims a background chopped for estimated_length seconds down to video_length.
+
+    Lets chop_background run with an estimate while the TTS is still synthesizing. The cuts
+    are stream copies, so trimming them is instant. If the estimate was too short, the
+    background is chopped again.
+
+    Args:
+        background_config (Dict[str,Tuple]]) : Current background configuration
+        estimated_length (float): The length chop_background was called with
+        video_length (int): The real length of the video
+    """
+    if video_length > estimated_length:
+        print_substep("The video is longer than estimated. Chopping the background again...")
+        chop_background(background_config, video_length, reddit_object)
+        return
+    id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
+    manifest = load_manifest(id)
+    background = manifest.background
+    background.end -= estimated_length - video_length
+    if background.path != background.source:
+        # a cut in assets/temp, in single render mode it's the library video itself
+        background.duration = background.offset + video_length
+        _trim(background.path, background.duration)
+    background_audio = manifest.background_audio
+    if background_audio is not None:
+        background_audio.duration = video_length
+    elif Path(f"assets/temp/{id}/background.mp3").is_file():
+        _trim(f"assets/temp/{id}/background.mp3", video_length)
+    save_manifest(id, background=background, background_audio=background_audio)
+    print_substep("Background trimmed to the length of the video.", style="bold green")
+
+
+def _trim(path: str, length: float):
+    trimmed = Path(path).with_name(f"trimmed-{Path(path).name}")
+    ffmpeg.input(path, t=length).output(str(trimmed), c="copy").overwrite_output().run(quiet=True)
+    trimmed.replace(path)
+
+
 # Create a tuple for downloads background (background_audio_options, background_video_options)
 background_options = load_background_options()
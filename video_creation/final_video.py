@@ -1,13 +1,14 @@
 import multiprocessing
 import os
 import re
+import subprocess
 import tempfile
 import textwrap
 import threading
 import time
 from os.path import exists  # Needs to be imported specifically
 from pathlib import Path
-from typing import Dict, Final, Tuple
+from typing import Dict, Final, List, Tuple
 
 import ffmpeg
 import os.path
@@ -17,9 +18,13 @@ from rich.console import Console
 from rich.progress import track
 
 from utils import settings
+from utils.audio import concat_wav
+from utils.captions import FONTS_DIR, Caption, write_ass
 from utils.cleanup import cleanup
 from utils.console import print_step, print_substep
 from utils.fonts import getheight
+from utils.manifest import load_manifest, save_manifest
+from utils.mixer import assemble
 from utils.thumbnail import create_thumbnail
 from utils.videos import save_data
 
@@ -84,10 +89,56 @@ def name_normalize(name: str) -> str:
         return name
 
 
+def get_audio_clip_names(number_of_clips: int) -> List[str]:
+    """The clips make_final_video joins into the narration, in order."""
+    if settings.config["settings"]["storymode"]:
+        if settings.config["settings"]["storymodemethod"] == 0:
+            return ["title", "postaudio"]
+        return ["title"] + [f"postaudio-{i}" for i in range(number_of_clips + 1)]
+    return ["title"] + [f"{i}" for i in range(number_of_clips)]
+
+
+def narration_gap() -> float:
+    """Seconds of silence put between the audio clips, only the numpy audio engine adds it."""
+    if settings.config["settings"]["audio_engine"] == "numpy":
+        return float(settings.config["settings"]["tts"]["silence_duration"])
+    return 0.0
+
+
+def run_with_filter_script(output, script_path: str):
+    """Runs an ffmpeg-python output with its filter graph read from script_path.
+
+    Long graphs would otherwise have to fit on the command line.
+    """
+    args = output.get_args()
+    if "-filter_complex" in args:
+        i = args.index("-filter_complex")
+        Path(script_path).write_text(args[i + 1], encoding="utf-8")
+        args[i : i + 2] = ["-filter_complex_script", script_path]
+    process = subprocess.run(["ffmpeg", *args], capture_output=True)
+    if process.returncode:
+        raise ffmpeg.Error("ffmpeg", process.stdout, process.stderr)
+
+
+def get_cropped_size(width: int, height: int, W: int, H: int) -> Tuple[int, int]:
+    """Size of a width x height background once it's cropped to the W:H aspect ratio.
+
+    The background keeps its height, so both render modes give the same frame. Crop rounds
+    the width to whole pixels, then down to even sizes for yuv420p.
+    """
+    if (width, height) == (W, H):
+        return W, H
+    return round(height * W / H) & ~1, height & ~1
+
+
 def prepare_background(reddit_id: str, W: int, H: int) -> str:
     output_path = f"assets/temp/{reddit_id}/background_noaudio.mp4"
+    background = load_manifest(reddit_id).background
+    if (background.width, background.height) == (W, H):
+        # cut from a proxy at the right size, the final render skips the offset itself
+        return background.path
     output = (
-        ffmpeg.input(f"assets/temp/{reddit_id}/background.mp4")
+        ffmpeg.input(background.path, ss=background.offset)
         .filter("crop", f"ih*({W}/{H})", "ih")
         .output(
             output_path,
@@ -106,6 +157,15 @@ def prepare_background(reddit_id: str, W: int, H: int) -> str:
     except ffmpeg.Error as e:
         print(e.stderr.decode("utf8"))
         exit(1)
+    # the cut was snapped to a keyframe, skipping the offset brings back the chosen window
+    background.start += background.offset
+    background.duration -= background.offset
+    background.offset = 0.0
+    background.width, background.height = get_cropped_size(
+        background.width, background.height, W, H
+    )
+    background.path = output_path
+    save_manifest(reddit_id, background=background)
     return output_path
 
 
@@ -249,7 +309,22 @@ def make_final_video(
 
     print_step("Creating the final video 🎥")
 
-    background_clip = ffmpeg.input(prepare_background(reddit_id, W=W, H=H))
+    single_pass = settings.config["settings"]["render_mode"] == "single"
+    captions = []
+    if single_pass:
+        # seek and crop the library video in the same ffmpeg run as everything else
+        manifest = load_manifest(reddit_id)
+        background = manifest.background
+        background_clip = ffmpeg.input(background.path, ss=background.offset, t=length)
+        if (background.width, background.height) != (W, H):
+            # the same crop as prepare_background, so both render modes give the same frame
+            background_clip = background_clip.filter("crop", f"ih*({W}/{H})", "ih")
+        frame_width, frame_height = get_cropped_size(background.width, background.height, W, H)
+    else:
+        background_path = prepare_background(reddit_id, W=W, H=H)
+
+        manifest = load_manifest(reddit_id)
+        background_clip = ffmpeg.input(background_path, ss=manifest.background.offset)
 
     # Gather all audio clips
     audio_clips = list()
@@ -258,47 +333,59 @@ def make_final_video(
             "No audio clips to gather. Please use a different TTS or post."
         )  # This is to fix the TypeError: unsupported operand type(s) for +: 'int' and 'NoneType'
         exit()
-    if settings.config["settings"]["storymode"]:
-        if settings.config["settings"]["storymodemethod"] == 0:
-            audio_clips = [ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3")]
-            audio_clips.insert(1, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/postaudio.mp3"))
-        elif settings.config["settings"]["storymodemethod"] == 1:
-            audio_clips = [
-                ffmpeg.input(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")
-                for i in track(range(number_of_clips + 1), "Collecting the audio files...")
-            ]
-            audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
-
-    else:
-        audio_clips = [
-            ffmpeg.input(f"assets/temp/{reddit_id}/mp3/{i}.mp3") for i in range(number_of_clips)
-        ]
-        audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
-
-        audio_clips_durations = [
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/{i}.mp3")["format"]["duration"])
-            for i in range(number_of_clips)
+    audio_clip_names = get_audio_clip_names(number_of_clips)
+    if not settings.config["settings"]["storymode"]:
+        audio_clips_durations = [manifest.clip(f"{i}").duration for i in range(number_of_clips)]
+        audio_clips_durations.insert(0, manifest.clip("title").duration)
+    audio_clips = [manifest.clip(name) for name in audio_clip_names]
+    audio_formats = {(clip.codec, clip.sample_rate, clip.channels) for clip in audio_clips}
+    mixed_audio_path = None
+    # the overlays and captions below are shifted by the same gaps
+    gap = narration_gap()
+    if settings.config["settings"]["audio_engine"] == "numpy":
+        # narration, background volume and ducking in one pass, see utils/mixer.py
+        audio_path = f"assets/temp/{reddit_id}/audio.wav"
+        background_audio = manifest.background_audio
+        background_audio_volume = settings.config["settings"]["background"][
+            "background_audio_volume"
         ]
-        audio_clips_durations.insert(
-            0,
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
+        if background_audio is not None and background_audio_volume != 0:
+            mixed_audio_path = f"assets/temp/{reddit_id}/audio_mixed.wav"
+        assemble(
+            [clip.path for clip in audio_clips],
+            audio_path,
+            gap=gap,
+            background=background_audio.path if mixed_audio_path else None,
+            background_start=background_audio.start if mixed_audio_path else 0.0,
+            background_volume=background_audio_volume,
+            ducking=settings.config["settings"]["background"]["background_audio_ducking"],
+            mixed_output=mixed_audio_path,
+            scratch_dir=f"assets/temp/{reddit_id}",
+        )
+    elif len(audio_formats) == 1 and audio_clips[0].codec.startswith("pcm_"):
+        # PCM clips of one format are joined by appending samples, the mux is their only encode
+        audio_path = f"assets/temp/{reddit_id}/audio.wav"
+        concat_wav([clip.path for clip in audio_clips], audio_path)
+    else:
+        audio_path = f"assets/temp/{reddit_id}/audio.mp3"
+        audio_concat = ffmpeg.concat(*[ffmpeg.input(clip.path) for clip in audio_clips], a=1, v=0)
+        ffmpeg.output(audio_concat, audio_path, **{"b:a": "192k"}).overwrite_output().run(
+            quiet=True
         )
-    audio_concat = ffmpeg.concat(*audio_clips, a=1, v=0)
-    ffmpeg.output(
-        audio_concat, f"assets/temp/{reddit_id}/audio.mp3", **{"b:a": "192k"}
-    ).overwrite_output().run(quiet=True)
 
     console.log(f"[bold green] Video Will Be: {length} Seconds Long")
 
     screenshot_width = int((W * 45) // 100)
-    audio_path = f"assets/temp/{reddit_id}/audio.mp3"
     if os.path.exists(audio_path):
         audio = ffmpeg.input(audio_path)
-        final_audio = merge_background_audio(audio, reddit_id)
+        if mixed_audio_path is not None:
+            final_audio = ffmpeg.input(mixed_audio_path)
+        else:
+            final_audio = merge_background_audio(audio, reddit_id)
     else:
         # Use silent audio if no audio file exists
         print_substep("No audio found, using silent audio track.")
-        final_audio = ffmpeg.input(f"anullsrc=r=44100:cl=mono", f="lavfi").output("pipe:", t=length, format="wav")["a"]
+        final_audio = ffmpeg.input("anullsrc=r=44100:cl=mono", f="lavfi", t=length)["a"]
 
     image_clips = list()
 
@@ -331,15 +418,9 @@ def make_final_video(
     current_time = 0
     if settings.config["settings"]["storymode"]:
         audio_clips_durations = [
-            float(
-                ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")["format"]["duration"]
-            )
-            for i in range(number_of_clips)
+            manifest.clip(f"postaudio-{i}").duration for i in range(number_of_clips)
         ]
-        audio_clips_durations.insert(
-            0,
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
-        )
+        audio_clips_durations.insert(0, manifest.clip("title").duration)
         if settings.config["settings"]["storymodemethod"] == 0:
             image_clips.insert(
                 1,
@@ -353,7 +434,7 @@ def make_final_video(
                 x="(main_w-overlay_w)/2",
                 y="(main_h-overlay_h)/2",
             )
-            current_time += audio_clips_durations[0]
+            current_time += audio_clips_durations[0] + gap
         elif settings.config["settings"]["storymodemethod"] == 1:
             for i in track(range(0, number_of_clips + 1), "Collecting the image files..."):
                 image_clips.append(
@@ -367,7 +448,7 @@ def make_final_video(
                     x="(main_w-overlay_w)/2",
                     y="(main_h-overlay_h)/2",
                 )
-                current_time += audio_clips_durations[i]
+                current_time += audio_clips_durations[i] + gap
     else:
         # --- New logic for margin and chunked comment display with fade transitions ---
         margin_x = int(W * 0.05)
@@ -377,51 +458,18 @@ def make_final_video(
         post_duration = 3  # seconds to display post
         fade_duration = 0.5  # seconds for fade in/out
 
-        # Get background video size
-        probe = ffmpeg.probe(f"assets/temp/{reddit_id}/background_noaudio.mp4")
-        video_stream = next((stream for stream in probe["streams"] if stream["codec_type"] == "video"), None)
-        bg_w = int(video_stream["width"])
-        bg_h = int(video_stream["height"])
-        # DEBUG: Overlay solid red color for first 5 seconds, full screen, top-left
-        # red_img = ffmpeg.input(f"color=c=red:s={bg_w}x{bg_h}:d=5:r=60", f="lavfi")["v"]
-        # background_clip = background_clip.overlay(
-        #     red_img,
-        #     enable=f"between(t,0,5)",
-        #     x="0",
-        #     y="0",
-        # )
         current_time = 5  # Start comments after post
 
-        # For each comment, render each chunk as text (no card, just text) using drawtext
+        # For each comment, show each chunk as a caption (no card, just text) for 2 seconds
         from video_creation.screenshot_downloader import split_comment_into_chunks
-        # Use a generic system font for debug
-        font_size = 48  # Adjust as needed
-        font_color = "white"  # Use white for comment text
-        font_border_color = "black"
-        font_border_width = 2
-        comment_y = "(h/2)"  # DEBUG: Center vertically
 
         for i in range(number_of_clips):
             comment = reddit_obj["comments"][i]
             chunks = split_comment_into_chunks(comment["comment_body"], min_words=1, max_words=3)
             for chunk in chunks:
-                # DEBUG: Always show text for 2 seconds, no fade, use Arial system font
-                print_substep(f"[DEBUG FONTCONFIG] About to draw comment chunk text: '{chunk}' with ffmpeg.drawtext (line 407)")
-                background_clip = ffmpeg.drawtext(
-                    background_clip,
-                    text=chunk,
-                    x="(w-text_w)/2",
-                    y=comment_y,
-                    fontsize=font_size,
-                    fontcolor=font_color,
-                    fontfile=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'fonts', 'Roboto-Black.ttf')),
-                    borderw=font_border_width,
-                    bordercolor=font_border_color,
-                    alpha=1,
-                    enable=f"between(t,{current_time},{current_time + 2})"
-                )
-                print_substep(f"[DEBUG FONTCONFIG] Completed drawing comment chunk text: '{chunk}' with ffmpeg.drawtext (line 417)")
+                captions.append(Caption(current_time, current_time + 2, chunk))
                 current_time += 2
+            current_time += gap
     title = re.sub(r"[^\w\s-]", "", reddit_obj["thread_title"])
     idx = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
     title_thumb = reddit_obj["thread_title"]
@@ -473,17 +521,13 @@ def make_final_video(
             print_substep(f"Thumbnail - Building Thumbnail in assets/temp/{reddit_id}/thumbnail.png")
 
     text = f"Background by {background_config['video'][2]}"
-    print_substep("[DEBUG FONTCONFIG] About to draw background credit text with ffmpeg.drawtext (line 472)")
-    background_clip = ffmpeg.drawtext(
-        background_clip,
-        text=text,
-        x=f"(w-text_w)",
-        y=f"(h-text_h)",
-        fontsize=5,
-        fontcolor="White",
-        fontfile=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'fonts', 'Roboto-Black.ttf')),
-    )
-    print_substep("[DEBUG FONTCONFIG] Completed drawing background credit text with ffmpeg.drawtext (line 481)")
+    captions.append(Caption(0, length, text, style="Credit"))
+    # all captions and the credit are drawn by one filter, however much text there is
+    if not single_pass:
+        frame_width, frame_height = manifest.background.width, manifest.background.height
+    captions_path = f"assets/temp/{reddit_id}/captions.ass"
+    write_ass(captions_path, captions, frame_width, frame_height)
+    background_clip = background_clip.filter("ass", captions_path, fontsdir=FONTS_DIR)
     # Overlay the post/title image at the start of the video for 3 seconds
     # Add rounded corners to the post image before overlay
     from PIL import Image, ImageDraw
@@ -545,23 +589,36 @@ def make_final_video(
             path[:251] + ".mp4"
         )  # Prevent a error by limiting the path length, do not change this.
         try:
-            print_substep("[DEBUG FONTCONFIG] About to call ffmpeg.output (line 496)")
-            ffmpeg.output(
-                background_clip,
-                path,
-                f="mp4",
-                **{
-                    "c:v": "h264",
-                    "b:v": "20M",
-                    "threads": multiprocessing.cpu_count(),
-                },
-            ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                quiet=True,
-                overwrite_output=True,
-                capture_stdout=False,
-                capture_stderr=False,
+            if single_pass:
+                # the only encode of the video, audio is muxed in the same run
+                output = ffmpeg.output(
+                    background_clip,
+                    final_audio,
+                    path,
+                    f="mp4",
+                    t=length,
+                    **{
+                        "c:v": "h264",
+                        "b:v": "20M",
+                        "b:a": "192k",
+                        "threads": multiprocessing.cpu_count(),
+                    },
+                )
+            else:
+                output = ffmpeg.output(
+                    background_clip,
+                    path,
+                    f="mp4",
+                    **{
+                        "c:v": "h264",
+                        "b:v": "20M",
+                        "threads": multiprocessing.cpu_count(),
+                    },
+                )
+            output = output.overwrite_output().global_args(
+                "-progress", progress.output_file.name
             )
-            print_substep("[DEBUG FONTCONFIG] Completed ffmpeg.output for background video only (line 515)")
+            run_with_filter_script(output, f"assets/temp/{reddit_id}/filter_graph.txt")
         except ffmpeg.Error as e:
             print(e.stderr.decode("utf8"))
             exit(1)
@@ -575,7 +632,7 @@ def make_final_video(
         print_step("Rendering the Only TTS Video 🎥")
         with ProgressFfmpeg(length, on_update_example) as progress:
             try:
-                ffmpeg.output(
+                output = ffmpeg.output(
                     background_clip,
                     audio,
                     path,
@@ -586,12 +643,8 @@ def make_final_video(
                         "b:a": "192k",
                         "threads": multiprocessing.cpu_count(),
                     },
-                ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                    quiet=True,
-                    overwrite_output=True,
-                    capture_stdout=False,
-                    capture_stderr=False,
-                )
+                ).overwrite_output().global_args("-progress", progress.output_file.name)
+                run_with_filter_script(output, f"assets/temp/{reddit_id}/filter_graph.txt")
             except ffmpeg.Error as e:
                 print(e.stderr.decode("utf8"))
                 exit(1)
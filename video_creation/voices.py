@@ -1,11 +1,14 @@
+from functools import partial
 from typing import Tuple
 
 from rich.console import Console
 
 from TTS.aws_polly import AWSPolly
 from TTS.elevenlabs import elevenlabs
-from TTS.engine_wrapper import TTSEngine
+from TTS.engine_wrapper import CHARS_PER_SECOND, DEFAULT_MAX_LENGTH, TTSEngine
+from TTS.failover import ProviderChain
 from TTS.GTTS import GTTS
+from TTS.local import LocalTTS
 from TTS.pyttsx import pyttsx
 from TTS.streamlabs_polly import StreamlabsPolly
 from TTS.TikTok import TikTok
@@ -21,6 +24,7 @@ TTSProviders = {
     "TikTok": TikTok,
     "pyttsx": pyttsx,
     "ElevenLabs": elevenlabs,
+    "Local": LocalTTS,
 }
 
 
@@ -35,7 +39,10 @@ def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
     """
 
     voice = settings.config["settings"]["tts"]["voice_choice"]
-    if str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
+    chain = get_provider_chain()
+    if chain is not None:
+        text_to_mp3 = TTSEngine(chain, reddit_obj)
+    elif str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
         text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, voice), reddit_obj)
     else:
         while True:
@@ -49,6 +56,50 @@ def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
     return text_to_mp3.run()
 
 
+def estimate_length(reddit_obj) -> float:
+    """Guesses the total length save_text_to_mp3 will return, without synthesizing anything.
+
+    Returns:
+        float: The estimated length in seconds. Comments stop at the maximum length of the
+        audio, so the estimate does too, but a story is always read in full
+    """
+    texts = [reddit_obj["thread_title"]]
+    if settings.config["settings"]["storymode"]:
+        post = reddit_obj["thread_post"]
+        texts += post if isinstance(post, list) else [post]
+        return sum(len(text) for text in texts) / CHARS_PER_SECOND
+    texts += [comment["comment_body"] for comment in reddit_obj["comments"]]
+    return min(sum(len(text) for text in texts) / CHARS_PER_SECOND, DEFAULT_MAX_LENGTH)
+
+
+def get_provider_chain():
+    """Builds the ProviderChain set in provider_chain, or returns None if it isn't set.
+
+    Returns:
+        A factory TTSEngine can instantiate like a TTS module
+    """
+    names = [
+        name.strip()
+        for name in str(settings.config["settings"]["tts"].get("provider_chain") or "").split(",")
+        if name.strip()
+    ]
+    if not names:
+        return None
+    providers = []
+    for name in names:
+        provider = get_case_insensitive_key_value(TTSProviders, name)
+        if provider is None:
+            raise ValueError(
+                f"Unknown TTS provider {name} in provider_chain. Options are: {list(TTSProviders)}"
+            )
+        providers.append(provider)
+    return partial(
+        ProviderChain,
+        providers,
+        hedge_percentile=settings.config["settings"]["tts"]["hedge_percentile"],
+    )
+
+
 def get_case_insensitive_key_value(input_dict, key):
     return next(
         (value for dict_key, value in input_dict.items() if dict_key.lower() == key.lower()),